@@ -16,6 +16,57 @@ type DB struct {
 	Bog        []byte
 	Toc        []byte
 	Decoder    *encoding.Decoder
+	Features   uint32
+	Sections   []Section
+	SuperToc   []byte // v2: TOC of the TOC, one page per SuperTocK TOC pages
+	SuperTocK  uint
+	// v2: per TOC page letter masks, fewest letters and tag highs
+	PageSummary    []byte
+	PageSummaryLen uint
+	// v2: precomputed answers, open addressing table of HotSlots slots
+	HotAnswers []byte
+	HotRecords []byte
+	HotSlots   uint
+	// v2: the highest value of every tag over all lines
+	TagMaxima []byte
+}
+
+// v2 sections, stored after the TOC
+const (
+	SectionSuperToc    = 1
+	SectionPageSummary = 2
+	SectionBitsetIndex = 3 // python tools only, safe to ignore
+	SectionHotAnswers  = 4
+	SectionTagMaxima   = 5
+	SectionPackEscapes = 6 // letter counts of packed (v3) lines
+	SectionBaseDelta   = 7 // lines are a delta of another db, not a whole db
+)
+
+// page summary: ANY_LETTERS (uint64) ALL_LETTERS (uint64) MIN_LETTERS (uint16)
+// followed by a high byte per tag
+const pageSummaryHead = 8 + 8 + 2
+
+// hot answers slot: KEY (uint64) FIRST (uint32) COUNT (uint32)
+const hotSlotLen = 8 + 4 + 4
+const hotSlotEmpty = 0xFFFFFFFF
+
+type Section struct {
+	ID        uint32
+	Offset    uint32
+	Size      uint32
+	ItemLen   uint32
+	ItemCount uint32
+	Arg       uint32
+}
+
+type SectionsHeader struct {
+	Features      uint32
+	SectionsCount uint32
+}
+
+type DBSections struct {
+	Features uint32
+	Table    []Section
 }
 
 type Tag struct {
@@ -82,6 +133,9 @@ func (db *DB) Show() {
 	}
 	pages, lines := db.CountTOC()
 	log.Printf("toc: %d÷%d\n", lines, pages)
+	for _, section := range db.Sections {
+		log.Printf("section: %+v\n", section)
+	}
 	log.Printf("bog: %d (%.2fMB)\n", len(db.Bog), float64(len(db.Bog))/(1024*1024))
 }
 
@@ -18,9 +18,10 @@ func ReadDataFile(file *os.File) *DB {
 	var db DB
 
 	var metadata *DBHeader
+	var sections *DBSections
 	var tags []Tag
 
-	metadata, tags, err = readHeader(file)
+	metadata, sections, tags, err = readHeader(file)
 	if err != nil {
 		log.Fatalf("Error reading metadata: %s", err)
 	}
@@ -52,6 +53,15 @@ func ReadDataFile(file *os.File) *DB {
 	toc, _ = readToc(file, metadata)
 	db.Toc = toc
 
+	if sections != nil {
+		db.Features = sections.Features
+		db.Sections = sections.Table
+		err = readSections(file, &db)
+		if err != nil {
+			log.Fatalf("Error reading sections: %s", err)
+		}
+	}
+
 	charset := strings.ToLower(string(bytes.Trim(metadata.Encoding[:], "\x00")))
 	db.Decoder = CreateDecoderByCharset(charset)
 
@@ -60,21 +70,42 @@ func ReadDataFile(file *os.File) *DB {
 	return &db
 }
 
-func readHeader(file *os.File) (*DBHeader, []Tag, error) {
+func readHeader(file *os.File) (*DBHeader, *DBSections, []Tag, error) {
 
 	startPosition := 0
 	_, err := file.Seek(int64(startPosition), io.SeekStart)
 	if err != nil {
-		return nil, nil, err
+		return nil, nil, nil, err
 	}
 
 	metadata := &DBHeader{}
 	err = binary.Read(file, binary.LittleEndian, metadata)
 	if err != nil {
-		return nil, nil, fmt.Errorf("failed to read metadata: %w", err)
+		return nil, nil, nil, fmt.Errorf("failed to read metadata: %w", err)
+	}
+	if metadata.Magic.Magic == [6]byte{'!', 's', 'l', 'v', 'B', 'R'} && metadata.Magic.Version == 0x0003 {
+		// v3 (packed records) is read by the python tools only
+		return nil, nil, nil, fmt.Errorf("packed db (version 3) is not supported, compile it without --pack-lines")
+	}
+	if metadata.Magic.Magic != [6]byte{'!', 's', 'l', 'v', 'B', 'R'} ||
+		(metadata.Magic.Version != 0x0001 && metadata.Magic.Version != 0x0002) {
+		return nil, nil, nil, fmt.Errorf("invalid magic header: %x", metadata.Magic.Magic)
 	}
-	if metadata.Magic.Magic != [6]byte{'!', 's', 'l', 'v', 'B', 'R'} || metadata.Magic.Version != 0x0001 {
-		return nil, nil, fmt.Errorf("invalid magic header: %x", metadata.Magic.Magic)
+
+	// v2: features and sections table go before the tags
+	var sections *DBSections
+	if metadata.Magic.Version >= 0x0002 {
+		head := SectionsHeader{}
+		err = binary.Read(file, binary.LittleEndian, &head)
+		if err != nil {
+			return nil, nil, nil, fmt.Errorf("failed to read sections header: %w", err)
+		}
+		table := make([]Section, head.SectionsCount)
+		err = binary.Read(file, binary.LittleEndian, table)
+		if err != nil {
+			return nil, nil, nil, fmt.Errorf("failed to read sections table: %w", err)
+		}
+		sections = &DBSections{Features: head.Features, Table: table}
 	}
 
 	charset := strings.ToLower(string(bytes.Trim(metadata.Encoding[:], "\x00")))
@@ -98,7 +129,79 @@ func readHeader(file *os.File) (*DBHeader, []Tag, error) {
 		}
 	}
 
-	return metadata, tags, nil
+	return metadata, sections, tags, nil
+}
+
+func readSections(file *os.File, db *DB) error {
+
+	for _, section := range db.Sections {
+		switch section.ID {
+		case SectionSuperToc:
+			if section.ItemLen != db.Meta.TOCLen {
+				return fmt.Errorf("bad super toc: %+v", section)
+			}
+			data, err := readSection(file, section)
+			if err != nil {
+				return err
+			}
+			db.SuperToc = data
+			db.SuperTocK = uint(section.Arg)
+		case SectionPageSummary:
+			if section.ItemCount != db.Meta.TOCCount ||
+				section.ItemLen != pageSummaryHead+db.Meta.TagsCount*db.Meta.TagLen {
+				return fmt.Errorf("bad page summary: %+v", section)
+			}
+			data, err := readSection(file, section)
+			if err != nil {
+				return err
+			}
+			db.PageSummary = data
+			db.PageSummaryLen = uint(section.ItemLen)
+		case SectionTagMaxima:
+			if section.ItemCount != db.Meta.TagsCount || section.ItemLen != db.Meta.TagLen {
+				return fmt.Errorf("bad tag maxima: %+v", section)
+			}
+			data, err := readSection(file, section)
+			if err != nil {
+				return err
+			}
+			db.TagMaxima = data
+		case SectionHotAnswers:
+			slots := uint(section.ItemCount)
+			if section.ItemLen != hotSlotLen || slots&(slots-1) != 0 ||
+				uint(section.Size) < slots*hotSlotLen {
+				return fmt.Errorf("bad hot answers: %+v", section)
+			}
+			data, err := readSection(file, section)
+			if err != nil {
+				return err
+			}
+			db.HotAnswers = data[:slots*hotSlotLen]
+			db.HotRecords = data[slots*hotSlotLen:]
+			db.HotSlots = slots
+		case SectionBitsetIndex:
+			log.Printf("bitset index section skipped: %+v\n", section)
+		case SectionPackEscapes, SectionBaseDelta:
+			// these change what the lines are, the db can not be served without them
+			return fmt.Errorf("unsupported section %d (packed or delta db): %+v", section.ID, section)
+		default:
+			log.Printf("unknown section skipped: %+v\n", section)
+		}
+	}
+	return nil
+}
+
+func readSection(file *os.File, section Section) ([]byte, error) {
+
+	data := make([]byte, section.Size)
+	n, err := file.ReadAt(data, int64(section.Offset))
+	if err != nil && err != io.EOF {
+		return nil, err
+	}
+	if n != int(section.Size) {
+		return nil, fmt.Errorf("failed to read full section %d: %w", section.ID, err)
+	}
+	return data, nil
 }
 
 func readLines(file *os.File, metadata *DBHeader) ([]byte, error) {
@@ -44,5 +44,33 @@ func (db *DB) StringToTagLine(q string, opts ...TagsOpts) ([]byte, int) {
 		}
 	}
 
+	db.clampTagLine(query)
 	return query, total
 }
+
+// clampTagLine cuts letter counts down to the db maxima: the same lines fit
+// and the query has the same cache key as any other asking for as much
+func (db *DB) clampTagLine(query []byte) {
+	if db.TagMaxima == nil {
+		return
+	}
+	for i := 0; i < len(db.Tags); i++ {
+		if db.Tags[i].Type == 0 && query[i] > db.TagMaxima[i] {
+			query[i] = db.TagMaxima[i]
+		}
+	}
+}
+
+// tagLineMayFit is false for a length, morph or flag value over the db
+// maxima: no line can fit that
+func (db *DB) tagLineMayFit(query []byte) bool {
+	if db.TagMaxima == nil {
+		return true
+	}
+	for i := 0; i < len(db.Tags); i++ {
+		if db.Tags[i].Type != 0 && query[i] > db.TagMaxima[i] {
+			return false
+		}
+	}
+	return true
+}
@@ -15,24 +15,107 @@ func (db *DB) CountTOC() (uint, uint) {
 	return pages, records
 }
 
+// pageFits checks the letter tags of a TOC (or super TOC) page
+func (db *DB) pageFits(toc []byte, tocOff uint, query []byte) bool {
+	tocFitLen := uint(db.Meta.TagLen * db.Meta.TagsCount)
+	for j := uint(0); j < tocFitLen; j++ {
+		if db.Tags[j].Type == 0 {
+			if query[j] < toc[tocOff+j] {
+				return false
+			}
+		}
+	}
+	return true
+}
+
+// superPageSkip tells how many TOC pages to skip from page i on: a super
+// page is checked at its first TOC page, all of them are skipped if it fails
+func (db *DB) superPageSkip(query []byte, i uint) uint {
+	if db.SuperTocK == 0 || i%db.SuperTocK != 0 {
+		return 0
+	}
+	superOff := (i / db.SuperTocK) * uint(db.Meta.TOCLen)
+	if db.pageFits(db.SuperToc, superOff, query) {
+		return 0
+	}
+	return db.SuperTocK
+}
+
+// pageQuery is what page summaries are checked against
+type pageQuery struct {
+	letters uint64 // bit k: k-th letter tag is in the query
+	total   uint   // letters in the query
+}
+
+func (db *DB) makePageQuery(query []byte) pageQuery {
+	pq := pageQuery{}
+	k := 0
+	for j, tag := range db.Tags {
+		if tag.Type != 0 {
+			continue
+		}
+		if query[j] > 0 && k < 64 {
+			pq.letters |= 1 << k
+		}
+		pq.total += uint(query[j])
+		k++
+	}
+	return pq
+}
+
+// pageSummaryFits tells if page i may hold a fitting line: no letter of
+// every line is missing from the query, a letter of some line is in it,
+// the query has enough letters, the length and morph/flag values asked for
+// are there
+func (db *DB) pageSummaryFits(i uint, query []byte, pq pageQuery) bool {
+	if db.PageSummary == nil {
+		return true
+	}
+	off := i * db.PageSummaryLen
+	summary := db.PageSummary[off : off+db.PageSummaryLen]
+	anyLetters := binary.LittleEndian.Uint64(summary[0:8])
+	allLetters := binary.LittleEndian.Uint64(summary[8:16])
+	minLetters := uint(binary.LittleEndian.Uint16(summary[16:18]))
+	if allLetters&^pq.letters != 0 || anyLetters&pq.letters == 0 || minLetters > pq.total {
+		return false
+	}
+	high := summary[pageSummaryHead:]
+	for j, tag := range db.Tags {
+		q := query[j]
+		if q == 0 {
+			continue
+		}
+		switch tag.Type {
+		case 1:
+			if high[j] < q {
+				return false
+			}
+		case 2, 3:
+			if high[j]&q != q {
+				return false
+			}
+		}
+	}
+	return true
+}
+
 func (db *DB) FindLineByTocFit(query []byte, recNo uint, pageNo uint) (int, uint, uint) {
 	tocFitLen := uint(db.Meta.TagLen * db.Meta.TagsCount)
 	skipPageFit := pageNo > 0 || recNo > 0
+	pq := db.makePageQuery(query)
+	if !db.tagLineMayFit(query) {
+		return 0, 0, 0
+	}
 	for i := uint(pageNo); i < uint(db.Meta.TOCCount); i++ {
 		tocOff := uint(i) * uint(db.Meta.TOCLen)
 
 		if !skipPageFit {
-			pageFits := true
-			for j := uint(0); j < tocFitLen; j++ {
-				if db.Tags[j].Type == 0 {
-					if query[j] < db.Toc[tocOff+j] {
-						pageFits = false
-						break
-					}
-				}
+			if skip := db.superPageSkip(query, i); skip > 0 {
+				i += skip - 1
+				continue
 			}
 
-			if !pageFits {
+			if !db.pageFits(db.Toc, tocOff, query) || !db.pageSummaryFits(i, query, pq) {
 				continue
 			}
 		}
@@ -58,28 +141,34 @@ func (db *DB) FindAllLinesByTocFit(query []byte, pageNo uint, limit int) (int, [
 
 	var tocRecs []uint = make([]uint, 0, 1000)
 	tocFitLen := uint(db.Meta.TagLen * db.Meta.TagsCount)
+	pq := db.makePageQuery(query)
+	if !db.tagLineMayFit(query) {
+		return 0, tocRecs
+	}
 
 	for i := uint(pageNo); i < uint(db.Meta.TOCCount); i++ {
 
+		if skip := db.superPageSkip(query, i); skip > 0 {
+			i += skip - 1
+			continue
+		}
+
 		tocOff := uint(i) * uint(db.Meta.TOCLen)
 
-		pageFits := true
-		for j := uint(0); j < tocFitLen; j++ {
-			if db.Tags[j].Type == 0 {
-				if query[j] < db.Toc[tocOff+j] {
-					pageFits = false
-					break
-				}
-			}
-		}
-		if !pageFits {
+		if !db.pageFits(db.Toc, tocOff, query) || !db.pageSummaryFits(i, query, pq) {
 			continue
 		}
 
 		recNo := uint(binary.LittleEndian.Uint32(db.Toc[tocOff+tocFitLen : tocOff+tocFitLen+4]))
 		count := uint(binary.LittleEndian.Uint32(db.Toc[tocOff+tocFitLen+4 : tocOff+tocFitLen+8]))
 
-		found, pageRecs := db.FindAllLinesFit(query, recNo, count, limit)
+		// the last page gives what is left up to the limit: lines of a page
+		// are in popularity order, so the best of them
+		pageLimit := limit
+		if limit > 0 {
+			pageLimit = limit - len(tocRecs)
+		}
+		found, pageRecs := db.FindAllLinesFit(query, recNo, count, pageLimit)
 		if found > 0 {
 			tocRecs = append(tocRecs, pageRecs...)
 		}
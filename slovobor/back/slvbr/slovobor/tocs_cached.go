@@ -1,8 +1,10 @@
 package slovobor
 
 import (
+	"encoding/binary"
 	"hash/crc64"
 	"log"
+	"math/bits"
 	"sync"
 )
 
@@ -12,11 +14,16 @@ var searchCache = make(map[uint64]interface{}, searchCacheLimit)
 
 func (db *DB) FindAllLinesByTocFitCached(query []byte, pageNo uint, limit int) (int, []uint, bool) {
 
+	key := makeCacheKey(query, pageNo, limit)
+	if records, found := db.FindHotAnswer(key); found {
+		log.Printf("hot hit key=%x, len=%d\n", key, len(records))
+		return len(records), records, true
+	}
+
 	searchCacheMx.Lock()
 	defer searchCacheMx.Unlock()
 	var records []uint
 
-	key := makeCacheKey(query, pageNo, limit)
 	if cached, found := searchCache[key]; found {
 		records := cached.([]uint)
 		log.Printf("cache hit key=%x, len=%d cached=%d\n", key, len(records), len(searchCache))
@@ -32,6 +39,34 @@ func (db *DB) FindAllLinesByTocFitCached(query []byte, pageNo uint, limit int) (
 	return length, records, false
 }
 
+// FindHotAnswer looks the key up in the hot answers section: from the home
+// slot (top bits of key × 2^64/φ) on up to an empty slot
+func (db *DB) FindHotAnswer(key uint64) ([]uint, bool) {
+	if db.HotSlots == 0 {
+		return nil, false
+	}
+	mask := db.HotSlots - 1
+	i := uint((key * 0x9E3779B97F4A7C15) >> (64 - bits.TrailingZeros(db.HotSlots)))
+	for n := uint(0); n < db.HotSlots; n++ {
+		slot := db.HotAnswers[i*hotSlotLen : (i+1)*hotSlotLen]
+		first := binary.LittleEndian.Uint32(slot[8:12])
+		if first == hotSlotEmpty {
+			return nil, false
+		}
+		if binary.LittleEndian.Uint64(slot[0:8]) == key {
+			count := uint(binary.LittleEndian.Uint32(slot[12:16]))
+			records := make([]uint, count)
+			for j := range records {
+				off := (uint(first) + uint(j)) * 4
+				records[j] = uint(binary.LittleEndian.Uint32(db.HotRecords[off : off+4]))
+			}
+			return records, true
+		}
+		i = (i + 1) & mask
+	}
+	return nil, false
+}
+
 func makeCacheKey(query []byte, pageNo uint, limit int) uint64 {
 	hasher := crc64.New(crc64.MakeTable(crc64.ISO))
 	hasher.Write(query)
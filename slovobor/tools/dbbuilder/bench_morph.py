@@ -0,0 +1,192 @@
+"""
+Micro-benchmark of the morphology classifier: MorphClassifier (one combined
+regex pass) vs the legacy chain of re.search calls; both are run on the same
+morphology sections and must agree on every one of them.
+
+    python bench_morph.py                              # built-in samples
+    python bench_morph.py ruwiktionary.xml.bz2 -n 100000   # sections from a dump
+"""
+
+import argparse
+import bz2
+import itertools
+import random
+import re
+import sys
+import time
+import xml.sax
+
+from parse_ruwiktionary_to_json import MORPH_RE, MorphClassifier, RUWikiReader
+
+
+def legacy_classify(mrph_txt, lang):
+    """morph letters, topo, nomen template -- as process_page used to do it"""
+    morph = ""
+    if (
+        re.search(r"\n{{\s*сущ[\- ]+" + lang, mrph_txt, re.I | re.M)
+        or re.search(r"\n{{\s*падежи\s*\n", mrph_txt, re.I | re.M)
+        or False
+    ):
+        morph += "N"
+    if re.search(r"\n{{\s*гл[\- ]+" + lang, mrph_txt, re.I | re.M):
+        morph += "V"
+    if (
+        re.search(r"\n{{\s*прил[\- ]+" + lang, mrph_txt, re.I | re.M)
+        or re.search(r"\n{{\s*Мс-п6", mrph_txt, re.I | re.M)
+        or False
+    ):
+        morph += "A"
+    if re.search(r"\n{{\s*числ[\- ]+", mrph_txt, re.I | re.M):
+        morph += "9"
+    if re.search(r"\n{{\s*adv[\- ]+" + lang, mrph_txt, re.I | re.M):
+        morph += "D"
+    if re.search(r"\n{{\s*(adv|predic|conj)[\- ]+" + lang, mrph_txt, re.I | re.M):
+        morph += "R"
+    if re.search(r"\n{{\s*(прич|деепр)[\- ]+", mrph_txt, re.I | re.M):
+        morph += "P"
+    if re.search(r"\n{{\s*мест[\- ]+", mrph_txt, re.I | re.M):
+        morph += "Z"
+    if re.search(r"\n{{\s*prep[\- ]+", mrph_txt, re.I | re.M):
+        morph += "S"
+    if re.search(r"\n{{\s*(intro|part)[\- ]+", mrph_txt, re.I | re.M):
+        morph += "T"
+    if re.search(r"\n{{\s*abbrev", mrph_txt, re.I | re.M):
+        morph += "B"
+    if re.search(r"\n{{\s*Фам[\- ]+", mrph_txt, re.M):
+        morph += "F"
+    if re.search(r"\n{{\s*interj[\- ]+", mrph_txt, re.I | re.M):
+        morph += "J"
+    if re.search(r"\n{{\s*onomatop[\- ]+", mrph_txt, re.I | re.M):
+        morph += "O"
+    topo = mrph_txt.find("{{топоним") >= 0 or mrph_txt.find("{{гидроним") >= 0
+    nomen = mrph_txt.find("{{собств.") >= 0
+    return morph, topo, nomen
+
+
+SAMPLE_MARKERS = (
+    "\n{{сущ ru m a 1a",
+    "\n{{ сущ-ru f ina 8a",
+    "\n{{падежи\n",
+    "\n{{падежи   \n{{гл ru 1a",
+    "\n{{гл ru нсв 1a",
+    "\n{{прил ru 1a",
+    "\n{{Мс-п6|ко",
+    "\n{{числ ru",
+    "\n{{adv ru",
+    "\n{{ADV-ru",
+    "\n{{predic ru",
+    "\n{{conj ru",
+    "\n{{прич ru",
+    "\n{{деепр ru",
+    "\n{{мест ru 6",
+    "\n{{prep ru",
+    "\n{{intro ru",
+    "\n{{part ru",
+    "\n{{abbrev",
+    "\n{{Фам ru m",
+    "\n{{фам ru m",
+    "\n{{interj ru",
+    "\n{{onomatop ru",
+    "\n{{сущ uk m",
+    "\n{{гл-en",
+    " {{сущ ru",
+    "\n{{\n{{сущ ru m",
+    "\n{{топоним}}",
+    "\n{{гидроним|ru}}",
+    "\n{{собств.|ru}}",
+    "\n{{Топоним}}",
+    "\n{{морфо|прист1=за|корень1=бег}}",
+    "\n\n{{по-слогам|бе|жать}}",
+    "\nкакой-то текст без шаблонов",
+)
+
+
+def sample_sections(count, seed=1):
+    rnd = random.Random(seed)
+    sections = []
+    for _ in range(count):
+        parts = rnd.sample(SAMPLE_MARKERS, rnd.randint(1, 6))
+        sections.append("".join(parts) + "\n")
+    return sections
+
+
+class EnoughSections(Exception):
+    pass
+
+
+class SectionsReader(RUWikiReader):
+    """collects morphology sections of the language blocks of a dump"""
+
+    def __init__(self, limit, **kwargs):
+        super().__init__(**kwargs)
+        self.limit = limit
+        self.sections = []
+
+    def process_page(self):
+        text = "".join(self.texts.get("text", []))  # the language block
+        if text:
+            self.sections.extend(mo.group(1) for mo in MORPH_RE.finditer(text))
+        if len(self.sections) >= self.limit:
+            raise EnoughSections()
+        return None
+
+
+def dump_sections(dump_name, lang, count):
+    reader = SectionsReader(count, lang=lang)
+    opener = bz2.open if dump_name.endswith(".bz2") else open
+    with opener(dump_name, "rb") as infile:
+        try:
+            xml.sax.parse(infile, reader)
+        except EnoughSections:
+            pass
+    return reader.sections[:count]
+
+
+def bench(name, func, sections, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in sections:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:>8}: {best:.3f}s best of {repeat} "
+        f"({best / len(sections) * 1e6:.2f} µs/section)",
+        file=sys.stderr,
+    )
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dump", nargs="?", help="wiktionary xml dump (or .bz2)")
+    parser.add_argument("--lang", default="ru", type=str)
+    parser.add_argument("-n", "--sections", default=20000, type=int)
+    parser.add_argument("-r", "--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    if args.dump:
+        sections = dump_sections(args.dump, args.lang, args.sections)
+    else:
+        sections = sample_sections(args.sections)
+    print(f"sections: {len(sections)}", file=sys.stderr)
+
+    classify = MorphClassifier(args.lang)
+
+    # same letters (legacy ones come in the same canonical order), same flags
+    for text in sections:
+        legacy, new = legacy_classify(text, args.lang), classify(text)
+        assert legacy == new, (text, legacy, new)
+    print("equivalent: OK", file=sys.stderr)
+
+    letters = sorted(set(itertools.chain(*(classify(t)[0] for t in sections))))
+    print(f"letters seen: {''.join(letters)}", file=sys.stderr)
+
+    old = bench("legacy", lambda t: legacy_classify(t, args.lang), sections, args.repeat)
+    new = bench("combined", classify, sections, args.repeat)
+    print(f"speedup: {old / new:.2f}x", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
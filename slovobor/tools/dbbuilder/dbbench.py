@@ -0,0 +1,237 @@
+"""
+Search cost of compiled DBs on a query corpus: every query is replayed with
+the backend semantics (StringToTagLine, TOC page pruning, page scan, limit),
+scan work and an estimated latency are summed up, two DBs side by side.
+
+    python dbbench.py data/db/ru.slvbr.db queries.log
+    python dbbench.py old.slvbr.db new.slvbr.db --queries slvbr.back.log
+
+Corpus lines are either backend log lines (`… q=вечность 16 o=1 n=0`, other log
+lines are skipped), url-encoded form data (`q=%D0%B2…&o=1&n=0`) or plain
+queries, one per line.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy
+
+from slvbrdb import (
+    Fit,
+    SearchStats,
+    SlvbrFile,
+    TagsOpts,
+    find_all_lines_by_toc_fit,
+    parse_query_line,
+    string_to_tagline,
+)
+
+
+def read_corpus(names, args):
+    corpus = []
+    for name in names:
+        infile = sys.stdin if name == "-" else open(name, encoding="utf-8")
+        for line in infile:
+            parsed = parse_query_line(line)
+            if parsed is None:
+                continue
+            q = parsed[0]
+            # backend parseQForm bounds are in bytes
+            if not args.query_min <= len(q.encode("utf-8")) <= args.query_max:
+                continue
+            corpus.append(parsed)
+        if infile is not sys.stdin:
+            infile.close()
+    if args.unique:
+        corpus = list(dict.fromkeys(corpus))
+    if args.limit_queries:
+        corpus = corpus[: args.limit_queries]
+    return corpus
+
+
+class CostModel:
+    """Go search latency estimate: ns per toc page checked, per record scanned,
+    per word returned (GetLineText) and per query"""
+
+    def __init__(self, page_ns, record_ns, match_ns, query_ns):
+        self.page_ns = page_ns
+        self.record_ns = record_ns
+        self.match_ns = match_ns
+        self.query_ns = query_ns
+
+    def estimate(self, pages, scanned, found):
+        return (
+            self.query_ns
+            + self.page_ns * pages
+            + self.record_ns * scanned
+            + self.match_ns * found
+        ) / 1000.0  # µs
+
+
+class Bench:
+
+    COLUMNS = ("pages", "pages_scanned", "scanned", "found", "est_us", "py_us")
+
+    def __init__(self, db, args):
+        self.db = db
+        self.args = args
+        self.records = len(db)
+        self.pages = db.meta.toc_count
+        self.model = CostModel(args.page_ns, args.record_ns, args.match_ns, args.query_ns)
+        self.total = SearchStats()
+        self.rows = []
+        self.results = []
+        self.untagged = 0
+
+    def run(self, corpus):
+        for q, o, n in corpus:
+            opts = TagsOpts(
+                only_noun=n != 0,
+                not_offensive=o != 0,
+                min_length=self.args.min_length,
+            )
+            query, tagged = string_to_tagline(self.db, q, opts)
+            if tagged == 0:
+                self.untagged += 1
+                self.results.append(None)
+                continue
+            stats = SearchStats()
+            fit = Fit(self.db, query)
+            started = time.perf_counter()
+            _, ids = find_all_lines_by_toc_fit(self.db, fit, 0, self.args.limit, stats)
+            elapsed = time.perf_counter() - started
+            estimate = self.model.estimate(stats.pages, stats.scanned, stats.found)
+            self.rows.append(
+                (
+                    stats.pages,
+                    stats.pages_scanned,
+                    stats.scanned,
+                    stats.found,
+                    estimate,
+                    elapsed * 1e6,
+                )
+            )
+            for name in SearchStats.FIELDS:
+                setattr(self.total, name, getattr(self.total, name) + getattr(stats, name))
+            self.total.elapsed += elapsed
+            if self.args.compare_words:
+                self.results.append(frozenset(self.db.line_bytes(i) for i in ids.tolist()))
+            else:
+                self.results.append(len(ids))
+        self.db = None
+        self.table = numpy.array(self.rows, dtype=numpy.float64).reshape(-1, len(self.COLUMNS))
+        return self
+
+    def summary(self):
+        """column → {statistic: value}"""
+        out = {}
+        for j, column in enumerate(self.COLUMNS):
+            values = self.table[:, j]
+            if len(values) == 0:
+                values = numpy.zeros(1)
+            out[column] = {
+                "mean": float(values.mean()),
+                "p50": float(numpy.percentile(values, 50)),
+                "p90": float(numpy.percentile(values, 90)),
+                "p99": float(numpy.percentile(values, 99)),
+                "max": float(values.max()),
+                "sum": float(values.sum()),
+            }
+        return out
+
+
+STATISTICS = ("mean", "p50", "p90", "p99", "max", "sum")
+
+
+def print_report(benches, names):
+    summaries = [b.summary() for b in benches]
+    head = f"{'':<22}" + "".join(f"{n[-24:]:>26}" for n in names)
+    if len(benches) == 2:
+        head += f"{'Δ':>10}"
+    print(head)
+    db_rows = [
+        ("records", [b.records for b in benches]),
+        ("toc pages", [b.pages for b in benches]),
+        ("queries", [b.total.queries for b in benches]),
+        ("untagged", [b.untagged for b in benches]),
+    ]
+    for label, values in db_rows:
+        print(format_row(label, values))
+    for column in Bench.COLUMNS:
+        for stat in STATISTICS:
+            values = [s[column][stat] for s in summaries]
+            print(format_row(f"{column} {stat}", values))
+
+
+def format_row(label, values):
+    row = f"{label:<22}" + "".join(f"{v:>26,.1f}" for v in values)
+    if len(values) == 2:
+        a, b = values
+        delta = (b - a) / a * 100 if a else 0.0
+        row += f"{delta:>+9.1f}%"
+    return row
+
+
+def compare_results(a, b, corpus, show=10):
+    differ = [i for i, (x, y) in enumerate(zip(a.results, b.results)) if x != y]
+    print(f"queries with different results: {len(differ)}/{len(corpus)}")
+    for i in differ[:show]:
+        print(f"  {corpus[i]}: {describe(a.results[i])} ≠ {describe(b.results[i])}")
+
+
+def describe(result):
+    if result is None:
+        return "untagged"
+    return str(result if isinstance(result, int) else len(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search cost of compiled DBs.")
+    parser.add_argument("db", type=str)
+    parser.add_argument("db2", type=str, nargs="?", help="second DB, side by side")
+    parser.add_argument("--queries", "-q", type=str, action="append", default=[])
+    # backend defaults: rsp-min, rsp-limit, query-min, query-max
+    parser.add_argument("--min-length", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--query-min", type=int, default=3)
+    parser.add_argument("--query-max", type=int, default=100)
+    parser.add_argument("--unique", action="store_true", help="each query once")
+    parser.add_argument("--limit-queries", type=int, default=0)
+    parser.add_argument("--compare-words", action="store_true")
+    # cost model, ns
+    parser.add_argument("--page-ns", type=float, default=10.0)
+    parser.add_argument("--record-ns", type=float, default=15.0)
+    parser.add_argument("--match-ns", type=float, default=60.0)
+    parser.add_argument("--query-ns", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    # `dbbench.py DB QUERIES` -- a second positional that is no db is a corpus
+    if args.db2 and not args.queries and not is_slvbr(args.db2):
+        args.queries, args.db2 = [args.db2], None
+    if not args.queries:
+        args.queries = ["-"]
+
+    corpus = read_corpus(args.queries, args)
+    print(f"corpus: {len(corpus)} queries", file=sys.stderr)
+
+    names = [args.db] + ([args.db2] if args.db2 else [])
+    benches = []
+    for name in names:
+        with SlvbrFile(name) as db:
+            bench = Bench(db, args).run(corpus)
+        print(f"{name}: {bench.total}", file=sys.stderr)
+        benches.append(bench)
+
+    print_report(benches, names)
+    if len(benches) == 2:
+        compare_results(benches[0], benches[1], corpus)
+
+
+def is_slvbr(name):
+    with open(name, "rb") as f:
+        return f.read(6) == b"!slvBR"
+
+
+if __name__ == "__main__":
+    main()
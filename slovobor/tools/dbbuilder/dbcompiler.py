@@ -1,14 +1,30 @@
-import bz2
+import abc
 import argparse
+import functools
+import hashlib
 import itertools
 import json
+import os
+import re
 import struct
 import sys
+import time
 from collections import Counter, defaultdict
 from statistics import mean, median
 
+import numpy
 from icu import LocaleData
 
+import recordio
+from slvbrdb import (
+    SlvbrFile,
+    TagsOpts,
+    cache_key,
+    find_all_lines_by_toc_fit,
+    parse_query_line,
+    string_to_tagline,
+)
+
 
 def fillit(size=0, fill=b"\x00"):
     return (fill * size)[:size]
@@ -20,20 +36,53 @@ FORMAT_SIZE = {1: "B", 2: "H", 4: "I"}
 class SlvbrDB:
 
     # DB := MAGIC (8b) META (+b) RECORDS (+b) BOG (+b) TOC (+b)
-
-    def __init__(self, title, encoding, lines):
-        self.magic = Magic()
-        self.bog = Bog(lines)
-        self.toc = TOC(lines)
+    # DB v2 := DB v1 + SECTIONS (+b), described in META v2
+    # DB v3 := DB v2 with packed RECORDS and TOC, described in META v3
+
+    def __init__(
+        self, title, encoding, lines, bog_pack="dedup", toc=None, sections=(), pack=False
+    ):
+        packer = BOG_PACKERS[bog_pack] if isinstance(bog_pack, str) else bog_pack
+        self.bog = packer(lines)
+        if pack:
+            lines.packing = Packing(lines)
+        self.toc = toc if toc is not None else TOC(lines)
         self.tags = TagsDict(lines)
-        self.meta = Meta(title, encoding, lines, self.bog, self.toc)
+        self.sections = [make(self.toc) for make in sections]
+        if pack and len(lines.packing.escapes):
+            self.sections.append(PackEscapes(lines.packing))
+        self.meta = Meta(title, encoding, lines, self.bog, self.toc, self.sections)
         self.lines = lines
+        self.layout()
+
+    def add_section(self, section, out):
+        # a section made from the written db itself (hot answers): appended
+        # to the db file, only the header (sections table) is rewritten
+        self.sections.append(section)
+        self.layout()
+        out.seek(0)
+        self.write_header(out)
+        out.seek(section.offset)
+        print(f"[6.{len(self.sections) - 1}] {section} ={out.tell()}")
+        section.write(out)
+        print(f"[X] ...         ={out.tell()} {out.tell() / (1024**2):.1f}MB")
+
+    def layout(self):
+        if self.lines.packing is not None:
+            self.magic = Magic(Magic.VERSION_3)
+        else:
+            self.magic = Magic(Magic.VERSION_2 if self.sections else Magic.VERSION)
+        # sections go after the toc, in order
+        pos = Meta.META_LEN + len(self.lines) * self.lines.length
+        pos += len(self.bog) + self.toc.count * self.toc.length
+        for section in self.sections:
+            section.offset = pos
+            pos += len(section)
 
     def data(self):
         binary = self.magic.data()
         binary += self.meta.data()
-        for line in self.lines:
-            binary += line.data()
+        binary += self.lines.data()
         return binary
 
     def goto(self, out, to, fill=b"\x00"):
@@ -41,11 +90,7 @@ class SlvbrDB:
         size = to - pos
         out.write(fillit(size, fill))
 
-    def write(self, out):
-        """…"""
-
-        print(f"[X] ...         ={out.tell()}")
-
+    def write_header(self, out):
         print(f"[1] magic       ={out.tell()}")
         out.write(self.magic.data())
 
@@ -55,12 +100,21 @@ class SlvbrDB:
         print(f"[2] tags        ={out.tell()}")
         out.write(self.tags.data())
 
-        self.goto(out, 1024, b"\xee")
+        assert out.tell() <= Meta.META_LEN, f"header overflow {out.tell()=}"
+        self.goto(out, Meta.META_LEN, b"\xee")
+
+    def write(self, out):
+        """…"""
+
+        print(f"[X] ...         ={out.tell()}")
+
+        self.write_header(out)
         print(f"[3] lines     ={out.tell()}")
-        for i, line in enumerate(self.lines):
-            if i < 3 or i % 20000 == 0:
-                print(f"[3.{i}] {line} ={out.tell()}")
-            line.write(out)
+        for i in sorted({0, 1, 2, *range(0, len(self.lines), 20000)}):
+            if i < len(self.lines):
+                pos = out.tell() + i * self.lines.length
+                print(f"[3.{i}] {self.lines.show(i)} ={pos}")
+        self.lines.write(out)
 
         print(f"[4] bog         ={out.tell()}")
         self.bog.write(out)
@@ -68,21 +122,31 @@ class SlvbrDB:
         print(f"[5] toc         ={out.tell()}")
         self.toc.write(out)
 
+        for i, section in enumerate(self.sections):
+            print(f"[6.{i}] {section} ={out.tell()}")
+            assert out.tell() == section.offset, f"{section.offset=}"
+            section.write(out)
+
         print(f"[X] ...         ={out.tell()} {out.tell() / (1024**2):.1f}MB")
 
 
 class Magic:
 
     # MAGIC := "!slvBR" (6b) + VERSION (int16, 2b)
-    # VERSION := 0x0001
+    # VERSION := 0x0001 | 0x0002 (with sections) | 0x0003 (packed lines)
 
     MAGIC = b"!slvBR"
     VERSION = 0x0001
+    VERSION_2 = 0x0002
+    VERSION_3 = 0x0003
     TEMPLATE = "<6sH"
     LEN = 8
 
+    def __init__(self, version=VERSION):
+        self.version = version
+
     def data(self):
-        return struct.pack(Magic.TEMPLATE, Magic.MAGIC, Magic.VERSION)
+        return struct.pack(Magic.TEMPLATE, Magic.MAGIC, self.version)
 
 
 class Meta:
@@ -99,31 +163,53 @@ class Meta:
     #   TAG_VALUE_LEN (4b) := 4
     #   BODY_LEN (4b) := 128
     #   TAG_DESCRIPTION (TAGS_COUNT × (TAG_TYPE_LEN + TAG_VALUE_LEN) b)
+    #
+    # META_DATA v2 := META_DATA v1 with, before TAG_DESCRIPTION,
+    #   FEATURES (4b) -- bit (1 << SECTION ID) per section present
+    #   SECTIONS_COUNT (4b)
+    #   SECTIONS_COUNT × SECTION (see Section)
+    #
+    # META_DATA v3 := META_DATA v2 with PACKING (see Packing) before the
+    #   sections; RECORD_LEN, BODY_LEN and TOC_LEN are of the packed ones
 
     TEMPLATE_DATA = "<128s8sIIIIIIIIIII"
+    TEMPLATE_V2 = "<II"
     META_LEN = 1024
 
-    def __init__(self, title, encoding, lines, bog, toc):
+    def __init__(self, title, encoding, lines, bog, toc, sections=()):
         self.title = title
         self.encoding = encoding
         self.lines = lines
         self.bog = bog
         self.toc = toc
+        self.sections = sections
 
     def data(self):
-        r0 = self.lines[0]
+        data = self.data_v1()
+        packing = self.lines.packing
+        if self.sections or packing is not None:
+            features = 0
+            for section in self.sections:
+                features |= 1 << section.ID
+            data += struct.pack(Meta.TEMPLATE_V2, features, len(self.sections))
+            if packing is not None:
+                data += packing.data()
+            data += b"".join(section.entry() for section in self.sections)
+        return data
+
+    def data_v1(self):
         return struct.pack(
             Meta.TEMPLATE_DATA,
             self.title.encode("ascii", errors="ignore"),
             self.encoding.encode("ascii", errors="ignore"),
             self.META_LEN,
             len(self.lines),
-            r0.length,
-            r0.tags_count,
-            r0.tag_len,
+            self.lines.length,
+            self.lines.tags_count,
+            self.lines.tag_len,
             TagsDict.TAG_TYPE_LEN,
             TagsDict.TAG_VALUE_LEN,
-            r0.body_len,
+            self.lines.body_len,
             len(self.bog),
             self.toc.length,
             self.toc.count,
@@ -140,116 +226,368 @@ class TagsDict:
 
     def __init__(self, lines):
         self.lines = lines
-        self.tags = lines[0].tags
+        self.tags = lines.tags
 
     def data(self):
         binary = b""
         for tag in self.tags:
             binary += struct.pack(
                 f"H{self.TAG_VALUE_LEN}s",
-                tag[2],
+                tag[1],
                 tag[0],
             )
         return binary
 
 
-class Line:
+class Lines:
+
+    # LINES := RECORDS_COUNT × LINE
+    # LINE := TAGS (TAGS_COUNT × TAG_LEN b) + BODY (BODY_LEN b)
+    # BODY := BOG_PTR (uint32, 4b) + BOG_LEN (uint32, 4b)
+    #
+    # kept column-wise: one RECORDS_COUNT × TAGS_COUNT uint8 matrix of tag
+    # values, a parallel RECORDS_COUNT × 2 uint32 matrix of bog pointers,
+    # and the line bodies
 
     TAG_LEN = 1
-    TAG_FORMAT = FORMAT_SIZE.get(TAG_LEN)
+    TAG_DTYPE = numpy.uint8
 
     BODY_LEN = 8
-    BODY_TEMPLATE = "<II"
+    BODY_DTYPE = numpy.dtype("<u4")
 
-    def __str__(self):
-        return f"Line({self.data_tags().hex()}, {self.bog_ptr})"
+    packing = None  # Packing of a v3 db
 
-    def __repr__(self):
-        return self.__str__()
+    def __init__(self, tags, matrix, bodies, scores=None):
+        assert matrix.shape == (len(bodies), len(tags)), f"{matrix.shape=}"
+        self.tags = tags
+        self.matrix = numpy.ascontiguousarray(matrix, dtype=self.TAG_DTYPE)
+        self.bodies = bodies
+        self.bog_ptr = numpy.zeros((len(bodies), 2), dtype=self.BODY_DTYPE)
+        self.scores = numpy.zeros(len(bodies)) if scores is None else scores
+
+    def reorder(self, order):
+        # in place -- the toc and the sections keep this very object
+        self.matrix = self.matrix[order]
+        self.bodies = [self.bodies[i] for i in order.tolist()]
+        self.bog_ptr = self.bog_ptr[order]
+        self.scores = self.scores[order]
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def show(self, i):
+        tags, ptr = self.matrix[i].tobytes(), tuple(self.bog_ptr[i].tolist())
+        return f"Line({tags.hex()}, {ptr})"
 
     @property
-    def length(self):
-        return self.tags_count * self.tag_len + self.body_len
+    def tags_count(self):
+        return len(self.tags)
 
     @property
-    def body_len(self):
-        return self.BODY_LEN
+    def tag_len(self):
+        return self.TAG_LEN
 
     @property
-    def body_offset(self):
+    def tags_len(self):
         return self.tags_count * self.tag_len
 
-    def __init__(self, tags, body):
-        self.tags = tags
-        self.tags_count = len(tags)
-        self.tag_len = self.TAG_LEN  # v1
-        self.tags_len = self.tags_count * self.tag_len
-        self.body = body
-        self.bog_ptr = (0, 0)
-
-    def data_tags(self):
-        binary = b"".join(
-            (struct.pack(f"{Line.TAG_FORMAT}", tag[1]) for tag in self.tags)
+    @property
+    def body_len(self):
+        if self.packing is not None:
+            return self.packing.body_len
+        return self.BODY_LEN
+
+    @property
+    def length(self):
+        if self.packing is not None:
+            return self.packing.tags_len + self.packing.body_len
+        return self.tags_len + self.body_len
+
+    def records(self):
+        if self.packing is not None:
+            return self.packing.records(self.matrix, self.bog_ptr)
+        records = numpy.empty(
+            len(self),
+            dtype=[
+                ("tags", self.TAG_DTYPE, (self.tags_count,)),
+                ("body", self.BODY_DTYPE, (2,)),
+            ],
         )
-        return binary
+        records["tags"] = self.matrix
+        records["body"] = self.bog_ptr
+        assert records.itemsize == self.length, f"{records.itemsize=}"
+        return records
 
-    def data_bog_pointer(self):
-        if self.bog_ptr is None:
-            return b""
-        return struct.pack(self.BODY_TEMPLATE, *self.bog_ptr)
+    def data(self):
+        return self.records().tobytes()
 
     def write(self, out):
-        bin_tags = self.data_tags()
-        assert len(bin_tags) == self.tags_len, f"{len(bin_tags)=}"
-        out.write(bin_tags)
-        bin_bog_ptr = self.data_bog_pointer()
-        assert len(bin_bog_ptr) == self.BODY_LEN, f"{len(bin_bog_ptr)=}"
-        out.write(bin_bog_ptr)
+        out.write(self.records().view(numpy.uint8))
+
+
+class Packing:
+
+    # PACKING := PACKED_TAGS (4b) + PTR_BITS (4b) + LEN_BITS (4b)
+    # packed LINE := NIBBLES + TAGS (the rest, TAG_LEN b each) + BODY
+    # NIBBLES := the first PACKED_TAGS tags (letters), 4 bits each, low
+    #   nibble first; ESCAPE (15) -- 15 or more, the value is in PACK_ESCAPES
+    # BODY := BOG_PTR | BOG_LEN << PTR_BITS, little-endian,
+    #   BODY_LEN := (PTR_BITS + LEN_BITS) / 8 rounded up
+    # packed PAGE := NIBBLES + TAGS + FIRST_LINE (uint32, 4b) + LINES_COUNT
+    #   (uint32, 4b); a page minimum over 15 is stored as 15 -- a lower
+    #   minimum only lets a page through, never drops a fitting line
+
+    TEMPLATE = "<III"
+    ESCAPE = 0x0F
+
+    def __init__(self, lines):
+        types = [tag[1] for tag in lines.tags]
+        self.packed_tags = next((i for i, t in enumerate(types) if t != 0), len(types))
+        self.rest = lines.tags_count - self.packed_tags
+        ptrs, lens = lines.bog_ptr[:, 0], lines.bog_ptr[:, 1]
+        self.ptr_bits = max(int(ptrs.max(initial=0)).bit_length(), 1)
+        self.len_bits = max(int(lens.max(initial=0)).bit_length(), 1)
+        self.body_len = -(-(self.ptr_bits + self.len_bits) // 8)
+        assert self.body_len <= 8, f"{self.ptr_bits=} {self.len_bits=}"
+        letters = lines.matrix[:, : self.packed_tags]
+        line, tag = numpy.nonzero(letters >= self.ESCAPE)
+        self.escapes = numpy.empty(len(line), dtype=PackEscapes.DTYPE)
+        self.escapes["line"] = line
+        self.escapes["tag"] = tag
+        self.escapes["value"] = letters[line, tag]
+        print(
+            f"packing: {self.packed_tags} nibble tags, body {self.ptr_bits}+{self.len_bits} "
+            f"bits, line {lines.tags_len + lines.BODY_LEN}b → {self.tags_len + self.body_len}b, "
+            f"{len(self.escapes)} escapes"
+        )
+
+    @property
+    def nibbles_len(self):
+        return (self.packed_tags + 1) // 2
+
+    @property
+    def tags_len(self):
+        return self.nibbles_len + self.rest * Lines.TAG_LEN
+
+    def data(self):
+        return struct.pack(Packing.TEMPLATE, self.packed_tags, self.ptr_bits, self.len_bits)
+
+    def tags(self, matrix):
+        # N × TAGS_COUNT → N × tags_len bytes, letters saturated at ESCAPE
+        letters = numpy.minimum(matrix[:, : self.packed_tags], self.ESCAPE)
+        if self.packed_tags % 2:
+            letters = numpy.column_stack([letters, numpy.zeros(len(matrix), Lines.TAG_DTYPE)])
+        nibbles = letters[:, 0::2] | (letters[:, 1::2] << 4)
+        return numpy.column_stack([nibbles, matrix[:, self.packed_tags :]]).astype(Lines.TAG_DTYPE)
+
+    def records(self, matrix, bog_ptr):
+        body = bog_ptr[:, 0].astype("<u8") | (bog_ptr[:, 1].astype("<u8") << self.ptr_bits)
+        body = body.reshape(-1, 1).view(numpy.uint8)[:, : self.body_len]
+        return numpy.ascontiguousarray(numpy.column_stack([self.tags(matrix), body]))
+
+    def pages(self, tags, pages):
+        pages = numpy.ascontiguousarray(pages, dtype=Lines.BODY_DTYPE).view(numpy.uint8)
+        return numpy.ascontiguousarray(numpy.column_stack([self.tags(tags), pages]))
 
 
 class Bog:
 
+    # BOG := append-only heap of line bodies, a body already present
+    # anywhere in the heap (even across two bodies) is reused, not appended
+    #
+    # every substring of the heap that is a known body is indexed once,
+    # at its first position, when the heap grows past its end;
+    # `prefixes` cuts the index walk at the first byte no body can continue
+
     def __init__(self, lines):
-        self.bog = bytes()
+        self.bog = bytearray()
         self.lines = lines
         self.stats = [0, 0]
+        self.bodies = set(lines.bodies)
+        self.prefixes = set(b[:i] for b in self.bodies for i in range(1, len(b)))
+        self.max_len = max(map(len, self.bodies), default=0)
+        self.index = {}
         print("bogging …")
-        for line in reversed(lines):
-            pointer = self.add(line.body)
-            line.bog_ptr = (pointer, len(line.body))
-        print(f"bogged {self.stats=} {len(self.bog)=}")
+        started = time.monotonic()
+        for i in reversed(range(len(lines))):
+            body = lines.bodies[i]
+            lines.bog_ptr[i] = (self.add(body), len(body))
+        print(
+            f"bogged {self.stats=} {len(self.bog)=} {len(self.index)=} "
+            f"in {time.monotonic() - started:.1f}s"
+        )
 
     def __len__(self):
         return len(self.bog)
 
     def add(self, bogus):
-        found = self.bog.find(bogus)
-        if found < 0:
+        found = self.index.get(bogus)
+        if found is None:
             self.stats[0] += 1
             pos = len(self.bog)
             self.bog += bogus
+            self.index_tail(pos)
             return pos
         else:
             self.stats[1] += 1
         return found
 
+    def index_tail(self, pos):
+        lo = max(0, pos - self.max_len + 1)
+        tail = bytes(self.bog[lo:])
+        for start, chunk in self.find_bodies(tail, pos - lo):
+            if chunk not in self.index:
+                self.index[chunk] = lo + start
+
+    def find_bodies(self, data, since=0):
+        # all (start, body) occurrences in data ending after `since`
+        for start in range(len(data)):
+            first = max(start + 1, since + 1)
+            last = min(start + self.max_len, len(data))
+            for stop in range(first, last + 1):
+                chunk = data[start:stop]
+                if chunk in self.bodies:
+                    yield start, chunk
+                if chunk not in self.prefixes:
+                    break
+
     def write(self, out):
         out.write(self.bog)
 
 
+class OverlapBog(Bog):
+
+    # BOG := greedy shortest common superstring of line bodies
+    #
+    # bodies found inside longer bodies are dropped, the rest are chained
+    # by the longest suffix→prefix overlap first (one successor and one
+    # predecessor per body, no cycles) and laid out chain by chain;
+    # a dropped body points into its container
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.stats = [0, 0]
+        self.dedup_len = len(Bog(lines))
+        self.bodies = set(lines.bodies)
+        self.prefixes = set(b[:i] for b in self.bodies for i in range(1, len(b)))
+        self.max_len = max(map(len, self.bodies), default=0)
+        print("bogging (overlap) …")
+        started = time.monotonic()
+        ordered = list(dict.fromkeys(reversed(lines.bodies)))
+        kept, contained = self.drop_contained(ordered)
+        succ, overlap = self.chain(kept)
+        self.bog, self.index = self.lay_out(kept, succ, overlap)
+        for body in ordered:
+            self.locate(body, contained)
+        for i, body in enumerate(lines.bodies):
+            pointer = self.index[body]
+            assert self.bog[pointer : pointer + len(body)] == body
+            lines.bog_ptr[i] = (pointer, len(body))
+        self.stats = [len(kept), len(lines) - len(kept)]
+        print(
+            f"bogged {self.stats=} {len(self.bog)=} {sum(overlap.values())=} "
+            f"saved={self.dedup_len - len(self.bog)} "
+            f"({1 - len(self.bog) / max(1, self.dedup_len):.1%}) "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    def drop_contained(self, ordered):
+        kept, contained = [], {}
+        for body in sorted(ordered, key=len, reverse=True):
+            if body in contained:
+                continue
+            kept.append(body)
+            for start, chunk in self.find_bodies(body):
+                if chunk != body and chunk not in contained:
+                    contained[chunk] = (body, start)
+        order = {body: i for i, body in enumerate(ordered)}
+        kept.sort(key=order.get)
+        return kept, contained
+
+    def chain(self, kept):
+        succ, overlap, heads = {}, {}, {body: body for body in kept}
+
+        def head(body):
+            while heads[body] != body:
+                heads[body] = heads[heads[body]]
+                body = heads[body]
+            return body
+
+        for k in range(self.max_len - 1, 0, -1):
+            starts = defaultdict(list)
+            for body in kept:
+                if body not in overlap and len(body) > k:
+                    starts[body[:k]].append(body)
+            for body in kept:
+                if body in succ or len(body) <= k:
+                    continue
+                candidates = starts.get(body[-k:])
+                if not candidates:
+                    continue
+                for i, after in enumerate(candidates):
+                    if after not in overlap and head(body) != after:
+                        succ[body], overlap[after] = after, k
+                        heads[after] = head(body)
+                        del candidates[i]
+                        break
+        return succ, overlap
+
+    def lay_out(self, kept, succ, overlap):
+        bog, index = bytearray(), {}
+        for body in kept:
+            if body in overlap:
+                continue
+            while body is not None:
+                index[body] = len(bog) - overlap.get(body, 0)
+                bog += body[overlap.get(body, 0) :]
+                body = succ.get(body)
+        return bog, index
+
+    def locate(self, body, contained):
+        if body not in self.index:
+            container, start = contained[body]
+            self.index[body] = self.locate(container, contained) + start
+        return self.index[body]
+
+
+class PatchBog(Bog):
+
+    # BOG := the bog of a base db, kept as is (its lines keep their pointers)
+    #   + the bodies of the added lines, found in it or appended
+
+    def __init__(self, lines, base_bog=b"", kept=0):
+        self.bog = bytearray(base_bog)
+        self.lines = lines
+        self.stats = [0, 0]
+        for i in range(kept, len(lines)):
+            body = lines.bodies[i]
+            pos = self.bog.find(body)
+            if pos < 0:
+                pos = len(self.bog)
+                self.bog += body
+                self.stats[0] += 1
+            else:
+                self.stats[1] += 1
+            lines.bog_ptr[i] = (pos, len(body))
+        print(f"bogged (patch) {self.stats=} {len(base_bog)=} → {len(self.bog)=}")
+
+
+BOG_PACKERS = {"dedup": Bog, "overlap": OverlapBog}
+
+
 class TOC:
 
-    TAG_LEN = 1
-    TAG_FORMAT = FORMAT_SIZE.get(TAG_LEN)
+    # TOC := TOC_COUNT × PAGE
+    # PAGE := TAGS (TAGS_COUNT × TAG_LEN b, per-tag minimum on the page)
+    #   + FIRST_LINE (uint32, 4b) + LINES_COUNT (uint32, 4b)
+
     TOC_LEN = 4 + 4
-    TOC_TEMPLATE = "<II"
 
     def __init__(self, lines, page_size=20):
         self.lines = lines
         self.page_size = page_size
         self.toc = []
         self.toq = []
-        self.length = lines[0].tags_len + self.TOC_LEN
         self.build_toc()
         self.compresse_toc()
 
@@ -257,18 +595,20 @@ class TOC:
     def count(self):
         return len(self.toc)
 
+    @property
+    def length(self):
+        if self.lines.packing is not None:
+            return self.lines.packing.tags_len + self.TOC_LEN
+        return self.lines.tags_len + self.TOC_LEN
+
     def build_toc(self):
         print("ToC'ing")
         toq = set()
-        i = 0
-        for rec_chunk in itertools.batched(self.lines, self.page_size):
-            toc = [tag[1] for tag in rec_chunk[0].tags]
-            c = 0
-            for rec in rec_chunk:
-                c += 1
-                toc = min_line(toc, [tag[1] for tag in rec.tags])
+        starts = numpy.arange(0, len(self.lines), self.page_size)
+        mins = numpy.minimum.reduceat(self.lines.matrix, starts, axis=0)
+        counts = numpy.diff(starts, append=len(self.lines))
+        for toc, i, c in zip(mins.tolist(), starts.tolist(), counts.tolist()):
             self.toc.append([toc, i, c])
-            i += c
             toq.add(tuple(toc[:-4]))
         print(
             f"ToC'ed {len(self.toc)=} {len(toq)=} "
@@ -296,58 +636,930 @@ class TOC:
             f"{max([x[2] for x in self.toc])=}"
         )
 
+    def order_pages(self):
+        # lines of every page by popularity (the highest first): a page
+        # keeps its lines, so its minimums, first line and count stay
+        counts = numpy.array([toc[2] for toc in self.toc], dtype=numpy.int64)
+        pages = numpy.repeat(numpy.arange(len(counts)), counts)
+        order = numpy.lexsort((-self.lines.scores, pages))
+        moved = int((order != numpy.arange(len(order))).sum())
+        self.lines.reorder(order)
+        return moved
+
+    def tags_matrix(self):
+        return numpy.array(
+            [toc[0] for toc in self.toc], dtype=Lines.TAG_DTYPE
+        ).reshape(len(self.toc), self.lines.tags_count)
+
+    def summaries(self):
+        # per page: letters on any / every line (bit k -- k-th letter tag),
+        # the fewest letters of a line, per-tag maximum (letters, length) or
+        # OR of the values (morph, flags)
+        matrix = self.lines.matrix
+        starts = numpy.array([toc[1] for toc in self.toc], dtype=numpy.int64)
+        letters = QueryModel.letter_columns(self.lines)
+        present = matrix[:, letters] > 0
+        bits = numpy.left_shift(numpy.uint64(1), numpy.arange(len(letters), dtype=numpy.uint64))
+        masks = (present * bits).sum(axis=1, dtype=numpy.uint64)
+        any_letters = numpy.bitwise_or.reduceat(masks, starts)
+        all_letters = numpy.bitwise_and.reduceat(masks, starts)
+        sums = matrix[:, letters].sum(axis=1, dtype=numpy.int64)
+        min_letters = numpy.minimum(numpy.minimum.reduceat(sums, starts), 0xFFFF)
+        types = numpy.array([tag[1] for tag in self.lines.tags])
+        high = numpy.where(
+            types <= 1,
+            numpy.maximum.reduceat(matrix, starts, axis=0),
+            numpy.bitwise_or.reduceat(matrix, starts, axis=0),
+        )
+        return any_letters, all_letters, min_letters, high
+
     def write(self, out):
-        for i, toc in enumerate(self.toc):
-            toc_tags = (
-                struct.pack(
-                    f"{self.TAG_FORMAT}",
-                    tag,
-                )
-                for tag in toc[0]
+        toc_ptrs = numpy.array([toc[1:] for toc in self.toc], dtype=Lines.BODY_DTYPE)
+        self.write_pages(out, self.tags_matrix(), toc_ptrs.reshape(len(self.toc), 2))
+
+    def write_pages(self, out, tags, pages):
+        if self.lines.packing is not None:
+            records = self.lines.packing.pages(tags, pages)
+            assert records.shape[1] == self.length, f"{records.shape=}"
+            out.write(records)
+            return
+        records = numpy.empty(
+            len(tags),
+            dtype=[
+                ("tags", Lines.TAG_DTYPE, (self.lines.tags_count,)),
+                ("page", Lines.BODY_DTYPE, (2,)),
+            ],
+        )
+        records["tags"] = tags
+        records["page"] = pages
+        assert records.itemsize == self.length, f"{records.itemsize=}"
+        out.write(records.view(numpy.uint8))
+
+
+class PatchTOC(TOC):
+
+    # TOC of a patched db: the pages of the base, less the removed lines
+    # (a minimum of fewer lines can only be lower than the page has), then
+    # fixed size pages of the added lines
+
+    def __init__(self, lines, pages, kept, page_size=20):
+        self.pages, self.kept = pages, kept
+        super().__init__(lines, page_size)
+
+    def build_toc(self):
+        self.toc = [page for page in self.pages if page[2] > 0]
+        base = len(self.toc)
+        if self.kept < len(self.lines):
+            starts = numpy.arange(self.kept, len(self.lines), self.page_size)
+            mins = numpy.minimum.reduceat(self.lines.matrix, starts, axis=0)
+            counts = numpy.diff(starts, append=len(self.lines))
+            for toc, i, c in zip(mins.tolist(), starts.tolist(), counts.tolist()):
+                self.toc.append([toc, i, c])
+        print(f"ToC'ed (patch) {len(self.toc)=} {base=} added={len(self.toc) - base}")
+
+    def compresse_toc(self, cropper=-4):
+        pass
+
+
+class Section(abc.ABC):
+
+    # SECTION := ID (4b) OFFSET (4b) SIZE (4b) ITEM_LEN (4b) ITEM_COUNT (4b) ARG (4b)
+    #   -- META v2 entry of ITEM_COUNT × ITEM_LEN bytes of data at OFFSET
+    #   (from the file start), ARG is up to the section
+
+    TEMPLATE = "<IIIIII"
+    ID = 0
+
+    offset = 0
+    item_len = 0
+    count = 0
+    arg = 0
+
+    def __len__(self):
+        return self.item_len * self.count
+
+    def __str__(self):
+        return f"{type(self).__name__}({self.count}×{self.item_len}, arg={self.arg})"
+
+    def entry(self):
+        return struct.pack(
+            Section.TEMPLATE,
+            self.ID,
+            self.offset,
+            len(self),
+            self.item_len,
+            self.count,
+            self.arg,
+        )
+
+    @abc.abstractmethod
+    def write(self, out):
+        """write the ITEM_COUNT × ITEM_LEN bytes of the section"""
+
+
+class SuperTOC(Section):
+
+    # SUPER_TOC := ITEM_COUNT × SUPER_PAGE, ARG := K
+    # SUPER_PAGE := TAGS (per-tag minimum of its K toc pages)
+    #   + FIRST_PAGE (uint32, 4b) + PAGES_COUNT (uint32, 4b)
+    #   -- same layout as a toc page, one per K toc pages
+
+    ID = 1
+
+    def __init__(self, toc, group=64):
+        self.toc = toc
+        self.arg = group
+        self.item_len = toc.length
+        self.starts = numpy.arange(0, toc.count, group)
+        self.counts = numpy.diff(self.starts, append=toc.count)
+        self.mins = numpy.minimum.reduceat(toc.tags_matrix(), self.starts, axis=0)
+        self.count = len(self.starts)
+
+    def write(self, out):
+        pages = numpy.column_stack([self.starts, self.counts])
+        self.toc.write_pages(out, self.mins, pages)
+
+    def skipped_pages(self, queries):
+        # queries: (queries × letter tags) letter counts, Go checks the letter
+        # tags only. → toc entries checked without and with the super toc,
+        # pages skipped, pages that fit
+        letters = QueryModel.letter_columns(self.toc.lines)
+        pages, supers = self.toc.tags_matrix()[:, letters], self.mins[:, letters]
+        checked_v1 = checked_v2 = skipped = fitting = 0
+        for chunk in range(0, len(queries), 256):
+            q = queries[chunk : chunk + 256][:, None, :]
+            super_fits = (supers[None, :, :] <= q).all(axis=2)
+            checked_v1 += len(q) * len(pages)
+            inside = int((super_fits * self.counts).sum())
+            checked_v2 += len(q) * len(supers) + inside
+            skipped += len(q) * len(pages) - inside
+            fitting += int((pages[None, :, :] <= q).all(axis=2).sum())
+        return checked_v1, checked_v2, skipped, fitting
+
+
+class PageSummary(Section):
+
+    # PAGE_SUMMARY := TOC_COUNT × SUMMARY, one per toc page, ARG := 0
+    # SUMMARY := ANY_LETTERS (uint64, 8b) -- bit k: k-th letter tag is on a line
+    #   + ALL_LETTERS (uint64, 8b) -- bit k: k-th letter tag is on every line
+    #   + MIN_LETTERS (uint16, 2b) -- fewest letters of a line
+    #   + HIGH (TAGS_COUNT × TAG_LEN b) -- per-tag maximum for letter and
+    #     length tags, OR of the values for morph and flag tags
+    # a page is skipped when a query can fit none of its lines: a letter on
+    # every line is not in the query, no letter on any line is, the query
+    # is shorter than any line, the longest line is shorter than asked, or
+    # an asked morph/flag value is on no line
+
+    ID = 2
+    MAX_LETTERS = 64
+    SUMMARY_LEN = 8 + 8 + 2
+
+    def __init__(self, toc):
+        self.toc = toc
+        self.item_len = self.SUMMARY_LEN + toc.lines.tags_len
+        self.count = toc.count
+        self.any_letters, self.all_letters, self.min_letters, self.high = toc.summaries()
+
+    def write(self, out):
+        records = numpy.empty(
+            self.count,
+            dtype=[
+                ("any", "<u8"),
+                ("all", "<u8"),
+                ("min_letters", "<u2"),
+                ("high", Lines.TAG_DTYPE, (self.toc.lines.tags_count,)),
+            ],
+        )
+        records["any"] = self.any_letters
+        records["all"] = self.all_letters
+        records["min_letters"] = self.min_letters
+        records["high"] = self.high
+        assert records.itemsize == self.item_len, f"{records.itemsize=}"
+        out.write(records.view(numpy.uint8))
+
+    def skipped_pages(self, queries):
+        # queries: (queries × letter tags) letter counts → pages passing the
+        # toc minimum check, and passing the summary check as well
+        letters = QueryModel.letter_columns(self.toc.lines)
+        mins = self.toc.tags_matrix()[:, letters]
+        bits = numpy.left_shift(numpy.uint64(1), numpy.arange(len(letters), dtype=numpy.uint64))
+        passed_toc = passed_summary = 0
+        for chunk in range(0, len(queries), 256):
+            q = queries[chunk : chunk + 256]
+            masks = ((q > 0) * bits).sum(axis=1, dtype=numpy.uint64)[:, None]
+            sums = q.sum(axis=1, dtype=numpy.int64)[:, None]
+            fits = (mins[None, :, :] <= q[:, None, :]).all(axis=2)
+            passed_toc += int(fits.sum())
+            fits &= (self.all_letters[None, :] & ~masks) == 0
+            fits &= (self.any_letters[None, :] & masks) != 0
+            fits &= self.min_letters[None, :] <= sums
+            passed_summary += int(fits.sum())
+        return passed_toc, passed_summary
+
+
+class BitsetIndex(Section):
+
+    # BITSET_INDEX := DIRECTORY + BITMAPS, ARG := BITMAPS_COUNT
+    #   -- variable size: ITEM_LEN := 1, ITEM_COUNT := SIZE
+    # DIRECTORY := TAGS_COUNT × (FIRST (uint32, 4b) + COUNT (uint32, 4b))
+    #   -- bitmaps FIRST … FIRST + COUNT - 1 of a tag; COUNT := 0 but for letters
+    # BITMAPS := BITMAPS_COUNT × BITMAP_OFFSET (uint32, 4b, from the section
+    #   start) + BITMAPS_COUNT × BITMAP
+    # BITMAP (tag t, threshold v) -- lines with more than v letters t:
+    #   CONTAINERS (uint32, 4b) + CONTAINERS × CONTAINER
+    # CONTAINER := KEY (uint16, line >> 16) + KIND (uint16) + N (uint32) + DATA
+    #   KIND 1 (array): N × uint16 -- line & 0xFFFF, ascending
+    #   KIND 2 (bitmap): 8192b -- bit (line & 0xFFFF), N lines set
+    #   KIND 3 (runs): N × (START (uint16) + LENGTH - 1 (uint16))
+    #   -- the smallest one of the three for the lines of the container
+    # lines of query q fitting the letter tags: NOT OR_t BITMAP(t, q[t])
+
+    ID = 3
+    ARRAY, BITMAP, RUNS = 1, 2, 3
+    CONTAINER_HEAD = "<HHI"
+    CHUNK = 1 << 16
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.item_len = 1
+        self.kinds = defaultdict(int)
+        self.directory = []
+        self.bitmaps = []
+        letters = set(QueryModel.letter_columns(lines))
+        for t in range(lines.tags_count):
+            column = lines.matrix[:, t]
+            high = int(column.max(initial=0)) if t in letters else 0
+            self.directory.append((len(self.bitmaps), high))
+            for v in range(high):
+                self.bitmaps.append(self.pack(numpy.flatnonzero(column > v)))
+        self.arg = len(self.bitmaps)
+        self.data = self.layout()
+        self.count = len(self.data)
+
+    def pack(self, ids):
+        data = [struct.pack("<I", 0)]
+        keys = ids >> 16
+        bounds = numpy.flatnonzero(numpy.diff(keys)) + 1
+        for chunk in numpy.split(ids, bounds) if len(ids) else []:
+            low = (chunk & 0xFFFF).astype("<u2")
+            breaks = numpy.flatnonzero(numpy.diff(low) != 1) + 1
+            starts = low[numpy.concatenate([[0], breaks])]
+            lengths = numpy.diff(numpy.concatenate([[0], breaks, [len(low)]]))
+            sizes = {self.ARRAY: 2 * len(low), self.BITMAP: self.CHUNK // 8, self.RUNS: 4 * len(starts)}
+            kind = min(sizes, key=sizes.get)
+            if kind == self.ARRAY:
+                n, payload = len(low), low.tobytes()
+            elif kind == self.BITMAP:
+                bits = numpy.zeros(self.CHUNK, dtype=bool)
+                bits[low] = True
+                n, payload = len(low), numpy.packbits(bits, bitorder="little").tobytes()
+            else:
+                runs = numpy.column_stack([starts, lengths - 1]).astype("<u2")
+                n, payload = len(starts), runs.tobytes()
+            self.kinds[kind] += 1
+            data.append(struct.pack(self.CONTAINER_HEAD, int(chunk[0]) >> 16, kind, n))
+            data.append(payload)
+        data[0] = struct.pack("<I", len(data) // 2)
+        return b"".join(data)
+
+    def layout(self):
+        directory = b"".join(struct.pack("<II", *entry) for entry in self.directory)
+        pos = len(directory) + 4 * len(self.bitmaps)
+        offsets = []
+        for bitmap in self.bitmaps:
+            offsets.append(pos)
+            pos += len(bitmap)
+        offsets = numpy.array(offsets, dtype="<u4").tobytes()
+        return directory + offsets + b"".join(self.bitmaps)
+
+    def write(self, out):
+        out.write(self.data)
+
+
+class TagMaxima(Section):
+
+    # TAG_MAXIMA := TAGS_COUNT × TAG_LEN b, ARG := 0
+    #   -- the highest value of every tag over all lines: a query asking for
+    #   more letters than any line has is clamped to it (same lines, same
+    #   cache key), one asking for a longer word or an unknown morph/flag
+    #   value has no lines at all
+
+    ID = 5
+
+    def __init__(self, lines):
+        self.item_len = lines.tag_len
+        self.count = lines.tags_count
+        self.maxima = lines.matrix.max(axis=0, initial=0).astype(Lines.TAG_DTYPE)
+
+    def write(self, out):
+        out.write(self.maxima.tobytes())
+
+
+class PackEscapes(Section):
+
+    # PACK_ESCAPES := ITEM_COUNT × ESCAPE, ARG := 0
+    # ESCAPE := LINE (uint32, 4b) + TAG (uint16, 2b) + VALUE (uint16, 2b)
+    #   -- the letter counts of 15 or more of a packed (v3) db, by line
+
+    ID = 6
+    DTYPE = numpy.dtype([("line", "<u4"), ("tag", "<u2"), ("value", "<u2")])
+
+    def __init__(self, packing):
+        self.item_len = self.DTYPE.itemsize
+        self.count = len(packing.escapes)
+        self.escapes = packing.escapes
+
+    def write(self, out):
+        out.write(self.escapes.tobytes())
+
+
+class BaseDelta(Section):
+
+    # BASE_DELTA := BASE_MD5 (16b) + ITEM_COUNT × LINE_ID (uint32, 4b),
+    #   ARG := RECORDS_COUNT of the base
+    #   -- a delta db: its lines are the ones added to the base db (the file
+    #   of BASE_MD5), LINE_ID -- the base lines removed from it, ascending
+
+    ID = 7
+
+    def __init__(self, md5, removed, base_lines):
+        self.md5 = bytes.fromhex(md5)
+        self.removed = numpy.asarray(removed, dtype="<u4")
+        self.item_len = 4
+        self.count = len(self.removed)
+        self.arg = base_lines
+
+    def __len__(self):
+        return len(self.md5) + self.item_len * self.count
+
+    def write(self, out):
+        out.write(self.md5)
+        out.write(self.removed.tobytes())
+
+
+class HotAnswers(Section):
+
+    # HOT_ANSWERS := SLOTS × SLOT + RECORDS, ITEM_COUNT := SLOTS (a power
+    #   of 2), ARG := LIMIT the answers are searched with
+    # SLOT := KEY (uint64, 8b) + FIRST (uint32, 4b) + COUNT (uint32, 4b)
+    #   -- KEY as Go makeCacheKey(query, 0, LIMIT), the answer is RECORDS
+    #   FIRST … FIRST + COUNT - 1; FIRST := 0xFFFFFFFF for an empty slot
+    # RECORDS := uint32 line numbers
+    # a key goes to slot HOME (see home()), or to the next empty one after
+
+    ID = 4
+    SLOT_DTYPE = numpy.dtype([("key", "<u8"), ("first", "<u4"), ("count", "<u4")])
+    EMPTY = 0xFFFFFFFF
+    # crc64 keys of similar queries are alike in any few bits, the slot is
+    # taken from the top bits of key × 2^64/φ (Fibonacci hashing)
+    SPREAD = 0x9E3779B97F4A7C15
+
+    @staticmethod
+    def home(key, slots):
+        return ((key * HotAnswers.SPREAD) & 0xFFFFFFFFFFFFFFFF) >> (65 - slots.bit_length())
+
+    def __init__(self, answers, limit):
+        # answers: [(key, line ids)], the hottest first
+        self.arg = limit
+        self.item_len = self.SLOT_DTYPE.itemsize
+        self.count = 1 << max(2 * len(answers) - 1, 1).bit_length()
+        self.slots = numpy.zeros(self.count, dtype=self.SLOT_DTYPE)
+        self.slots["first"] = self.EMPTY
+        mask, first, records, self.probes = self.count - 1, 0, [], 0
+        for key, ids in answers:
+            i = self.home(key, self.count)
+            while self.slots["first"][i] != self.EMPTY:
+                i = (i + 1) & mask
+                self.probes += 1
+            self.slots[i] = (key, first, len(ids))
+            records.append(numpy.asarray(ids, dtype="<u4"))
+            first += len(ids)
+        self.records = numpy.concatenate(records) if records else numpy.empty(0, "<u4")
+
+    def __len__(self):
+        return self.item_len * self.count + self.records.nbytes
+
+    def write(self, out):
+        out.write(self.slots.view(numpy.uint8))
+        out.write(self.records.view(numpy.uint8))
+
+
+def hot_answers(args):
+    # the top --hot-count query tag lines of the --hot-queries log, answered
+    # by the reference search on the db as written
+    with open(args.hot_queries, encoding="utf-8") as infile:
+        parsed = list(filter(None, map(parse_query_line, infile)))
+    with SlvbrFile(args.output) as db:
+        seen, queries = defaultdict(int), {}
+        for q, o, n in parsed:
+            opts = TagsOpts(only_noun=n != 0, not_offensive=o != 0, min_length=args.hot_min_length)
+            query, tagged = string_to_tagline(db, q, opts)
+            if tagged == 0:
+                continue
+            key = cache_key(query, 0, args.hot_limit)
+            seen[key] += 1
+            queries.setdefault(key, query)
+        top = sorted(seen, key=seen.get, reverse=True)[: args.hot_count]
+        answers = []
+        for key in top:
+            _, ids = find_all_lines_by_toc_fit(db, queries[key], 0, args.hot_limit)
+            answers.append((key, ids))
+    section = HotAnswers(answers, args.hot_limit)
+
+    total = max(len(parsed), 1)
+    hits = numpy.cumsum([seen[key] for key in top]) if top else numpy.zeros(1)
+    covered = ", ".join(
+        f"top {k}: {hits[min(k, len(hits)) - 1] / total * 100:.1f}%"
+        for k in sorted({max(len(top) // 100, 1), max(len(top) // 10, 1), len(top) or 1})
+    )
+    print(
+        f"hot answers: {len(top)} of {len(seen)} query tag lines, "
+        f"{len(section)}b ({section.count} slots, {section.probes} probes past the "
+        f"first slot), coverage of {len(parsed)} log queries -- {covered}"
+    )
+    return section
+
+
+class CachedTOC(TOC):
+
+    # TOC of pages built before (StageCache), as [mins, first line, count]
+
+    def __init__(self, lines, pages):
+        self.pages = pages
+        super().__init__(lines)
+
+    def build_toc(self):
+        self.toc = self.pages
+        print(f"ToC'ed (cached) {len(self.toc)=}")
+
+    def compresse_toc(self, cropper=-4):
+        pass
+
+    @staticmethod
+    def save(toc, out):
+        numpy.savez(
+            out,
+            mins=toc.tags_matrix(),
+            pages=numpy.array([page[1:] for page in toc.toc], dtype=numpy.int64).reshape(-1, 2),
+        )
+
+    @staticmethod
+    def load(infile):
+        with numpy.load(infile) as data:
+            return [
+                [mins, first, count]
+                for mins, (first, count) in zip(data["mins"].tolist(), data["pages"].tolist())
+            ]
+
+
+class StageCache:
+
+    # DIR/STAGE-KEY.EXT := a stage result; KEY := sha256 of the stage name,
+    #   the key of the stage it is computed from and the arguments it reads,
+    #   so a changed argument only misses the stages after it.
+    # no DIR (or a key of an unknown part, like stdin input) -- no caching
+
+    def __init__(self, path=None):
+        self.path = path
+        self.keys = {}
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, stage, *parts):
+        key = None
+        if self.path and all(part is not None for part in parts):
+            digest = hashlib.sha256(stage.encode("utf-8"))
+            for part in parts:
+                digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+            key = digest.hexdigest()[:32]
+        self.keys[stage] = key
+        return key
+
+    def stage(self, stage, compute, save, load, ext="npz"):
+        # load(file) of a cached result, else compute() and save(result, file)
+        key = self.keys.get(stage)
+        if key is None:
+            return compute()
+        path = os.path.join(self.path, f"{stage}-{key}.{ext}")
+        if os.path.exists(path):
+            print(f"{stage}: cached {path}")
+            with open(path, "rb") as infile:
+                return load(infile)
+        started = time.monotonic()
+        result = compute()
+        with open(path + ".tmp", "wb") as out:
+            save(result, out)
+        os.replace(path + ".tmp", path)
+        print(f"{stage}: {time.monotonic() - started:.1f}s, cached {path}")
+        return result
+
+
+# arguments the stages read, besides the stage before them
+WORDS_OPTIONS = ("morph", "min_length", "no_topo", "no_nomen", "limit", "popularity")
+COUNTS_OPTIONS = ("case_sensitive", "tags_alpha_only", "popularity")
+TOC_OPTIONS = ("toc_strategy", "toc_max_page")
+
+
+def stage_options(args, names):
+    return {name: getattr(args, name) for name in names}
+
+
+def source_digest(path, args):
+    # a cached stage of a file is keyed by its content, of stdin -- not cached
+    if args.cache_dir and path and os.path.isfile(path):
+        return file_md5(path)
+    return None
+
+
+def save_json(value, out):
+    out.write(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def load_json(infile):
+    return json.loads(infile.read().decode("utf-8"))
+
+
+def save_npy(value, out):
+    numpy.save(out, value)
+
+
+class QueryModel:
+
+    # chance of a query to pass a toc page check, Go: q[t] >= min[t] for every
+    # letter tag t; letters are taken as independent, so
+    # log P(pass | min) = Σ_t log P(q[t] >= min[t]) -- one table lookup per tag
+
+    def __init__(self, lines, counts):
+        # counts: (queries × letter tags) letter counts of the sample queries
+        self.letters = numpy.array(self.letter_columns(lines), dtype=numpy.intp)
+        self.size = len(counts)
+        hist = numpy.zeros((len(self.letters), 257), dtype=numpy.float64)
+        for t in range(len(self.letters)):
+            hist[t, :256] = numpy.bincount(counts[:, t], minlength=256)[:256]
+        at_least = numpy.cumsum(hist[:, ::-1], axis=1)[:, ::-1]  # P(q[t] >= v)·n
+        # a half query more for every value -- no page is ever "never scanned"
+        p = (at_least[:, :256] + 0.5) / (self.size + 1.0)
+        p[:, 0] = 1.0
+        self.log_ge = numpy.log(p).astype(numpy.float32)
+        self.cols = numpy.arange(len(self.letters))
+
+    @staticmethod
+    def count_letters(queries, letters, case_sensitive=False):
+        # letters: the letter tags (in lines.tags order), as the queries see them
+        counts = numpy.zeros((len(queries), len(letters)), dtype=numpy.uint8)
+        for k, q in enumerate(queries):
+            q = q if case_sensitive else q.lower()
+            for t, c in enumerate(letters):
+                counts[k, t] = min(q.count(c), 255)
+        return counts
+
+    @staticmethod
+    def letter_columns(lines):
+        return [i for i, tag in enumerate(lines.tags) if tag[1] == 0]
+
+    def pass_probability(self, mins):
+        # mins: (pages × letter tags) page minimums
+        return numpy.exp(self.log_ge[self.cols, mins].sum(axis=1, dtype=numpy.float64))
+
+    def expected_cost(self, toc, page_cost=1.0):
+        # expected records scanned (+ toc entries checked) by a query
+        mins = numpy.array([t[0] for t in toc], dtype=numpy.uint8)[:, self.letters]
+        counts = numpy.array([t[2] for t in toc], dtype=numpy.float64)
+        return float((self.pass_probability(mins) * counts).sum() + page_cost * len(toc))
+
+
+class CostTOC(TOC):
+
+    # page boundaries by dynamic programming over the sorted lines:
+    #   best[j] = min over w ≤ max_page of best[j - w] + cost(j - w, w)
+    #   cost(i, w) = page_cost + P(pass | min of lines[i:i+w]) · w
+    # every page of every size is priced once, window minimums are grown
+    # a line at a time (w × lines × tags)
+
+    def __init__(self, lines, model, max_page=48, page_cost=1.0):
+        self.model = model
+        self.max_page = max_page
+        self.page_cost = page_cost
+        super().__init__(lines, page_size=max_page)
+
+    def page_costs(self):
+        letters = self.lines.matrix[:, self.model.letters]
+        n, width = len(letters), min(self.max_page, len(letters))
+        costs = numpy.full((width, n), numpy.inf, dtype=numpy.float32)
+        mins = letters
+        for w in range(1, width + 1):
+            if w > 1:
+                mins = numpy.minimum(mins[:-1], letters[w - 1 :])
+            costs[w - 1, : n - w + 1] = (
+                self.model.pass_probability(mins) * w + self.page_cost
+            )
+        return costs
+
+    def build_toc(self):
+        print("ToC'ing by cost")
+        started = time.time()
+        n = len(self.lines)
+        costs = self.page_costs()
+        best = numpy.zeros(n + 1, dtype=numpy.float64)
+        cut = numpy.zeros(n + 1, dtype=numpy.int64)
+        for j in range(1, n + 1):
+            ws = numpy.arange(1, min(len(costs), j) + 1)
+            candidates = best[j - ws] + costs[ws - 1, j - ws]
+            k = int(candidates.argmin())
+            best[j], cut[j] = candidates[k], j - ws[k]
+
+        starts = []
+        j = n
+        while j > 0:
+            starts.append(int(cut[j]))
+            j = starts[-1]
+        starts = numpy.array(starts[::-1], dtype=numpy.int64)
+
+        mins = numpy.minimum.reduceat(self.lines.matrix, starts, axis=0)
+        counts = numpy.diff(starts, append=n)
+        for toc, i, c in zip(mins.tolist(), starts.tolist(), counts.tolist()):
+            self.toc.append([toc, i, c])
+        print(
+            f"ToC'ed {len(self.toc)=} "
+            f"{sum([x[2] for x in self.toc])=} "
+            f"{max([x[2] for x in self.toc])=} "
+            f"expected={best[n]:.1f} "
+            f"{time.time() - started:.1f}s"
+        )
+
+    def compresse_toc(self, cropper=-4):
+        # merging pages is a choice the dp has made already
+        pass
+
+
+def sample_queries(lines, args, size=0):
+    """(queries × letter tags) letter counts of the --toc-queries sample, or
+    dictionary-uniform -- the db words themselves; `size` random ones of them"""
+    if args.toc_queries:
+        with open(args.toc_queries, encoding="utf-8") as infile:
+            queries = [q for q, _, _ in filter(None, map(parse_query_line, infile))]
+        counts = QueryModel.count_letters(queries, args.tags, args.case_sensitive)
+    else:
+        counts = lines.matrix[:, QueryModel.letter_columns(lines)]
+    if size and len(counts) > size:
+        rng = numpy.random.default_rng(0)
+        counts = counts[numpy.sort(rng.choice(len(counts), size, replace=False))]
+    return counts
+
+
+def make_toc(lines, args):
+    if args.toc_strategy == "fixed":
+        return TOC(lines)
+
+    model = QueryModel(lines, sample_queries(lines, args))
+    print(f"query model: {model.size} queries")
+
+    toc = CostTOC(lines, model, max_page=args.toc_max_page)
+    fixed = TOC(lines)
+    print(
+        f"expected scan per query: fixed={model.expected_cost(fixed.toc):.1f} "
+        f"cost={model.expected_cost(toc.toc):.1f}"
+    )
+    return toc
+
+
+def make_sections(lines, args):
+    # v2 sections, built once the toc is: [section(toc), …]
+    sections = []
+    if args.super_toc:
+
+        def super_toc(toc):
+            section = SuperTOC(toc, args.super_toc)
+            queries = sample_queries(lines, args, size=2000)
+            v1, v2, skipped, fitting = section.skipped_pages(queries)
+            n = max(len(queries), 1)
+            print(
+                f"super toc: {section.count}×{section.arg}; per query "
+                f"toc entries checked {v1 / n:.1f} → {v2 / n:.1f}, "
+                f"pages skipped {skipped / n:.1f}, fitting {fitting / n:.1f} "
+                f"({len(queries)} queries)"
+            )
+            return section
+
+        sections.append(super_toc)
+    if args.page_summary:
+        if len(QueryModel.letter_columns(lines)) > PageSummary.MAX_LETTERS:
+            raise SystemExit(f"page summary: over {PageSummary.MAX_LETTERS} letter tags")
+
+        def page_summary(toc):
+            section = PageSummary(toc)
+            queries = sample_queries(lines, args, size=2000)
+            passed_toc, passed_summary = section.skipped_pages(queries)
+            n = max(len(queries), 1)
+            toc_size = toc.count * toc.length
+            print(
+                f"page summary: {section.count}×{section.item_len}b = {len(section)}b "
+                f"(+{len(section) / toc_size * 100:.0f}% of toc {toc_size}b); "
+                f"per query pages to scan {passed_toc / n:.1f} → "
+                f"{passed_summary / n:.1f} ({len(queries)} queries, letters only)"
+            )
+            return section
+
+        sections.append(page_summary)
+    if args.tag_maxima:
+
+        def tag_maxima(toc):
+            section = TagMaxima(lines)
+            letters = QueryModel.letter_columns(lines)
+            print(
+                f"tag maxima: letters {bytes(section.maxima[letters]).hex()} "
+                f"others {bytes(numpy.delete(section.maxima, letters)).hex()}"
+            )
+            return section
+
+        sections.append(tag_maxima)
+    if args.bitset_index:
+
+        def bitset_index(toc):
+            section = BitsetIndex(lines)
+            records = len(lines) * lines.tags_len
+            kinds = {"array": BitsetIndex.ARRAY, "bitmap": BitsetIndex.BITMAP, "runs": BitsetIndex.RUNS}
+            print(
+                f"bitset index: {section.arg} bitmaps, {len(section)}b "
+                f"({len(section) / records * 100:.0f}% of records tags {records}b); "
+                + " ".join(f"{name}={section.kinds[kind]}" for name, kind in kinds.items())
+            )
+            return section
+
+        sections.append(bitset_index)
+    return sections
+
+
+class Words:
+
+    # WORDS := per-word columns, encoded once and shared by all stages:
+    #   COUNTS (N × len(LETTERS), uint8) -- letter counts
+    #   LENGTH, MORPH (first morph letter), OFFENSIVE, TOPO, NOMEN
+    #   SCORE -- popularity, orders lines within a toc page
+
+    COLUMNS = ("counts", "length", "morph", "offensive", "topo", "nomen", "score")
+
+    def __init__(self, words, letters, case_sensitive=False, **columns):
+        self.words = words
+        self.letters = letters
+        self.case_sensitive = case_sensitive
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.words)
+
+    def show(self, i):
+        i = range(len(self))[i]
+        counters = {
+            c: n for c, n in zip(self.letters, self.counts[i].tolist()) if n > 0
+        }
+        return {
+            "word": self.words[i],
+            "morph": chr(self.morph[i]),
+            "offensive": bool(self.offensive[i]),
+            "topo": bool(self.topo[i]),
+            "nomen": bool(self.nomen[i]),
+            "__len": int(self.length[i]),
+            "__counters": counters,
+        }
+
+    def seen_letters(self):
+        seen = numpy.flatnonzero(self.counts.any(axis=0))
+        return "".join(self.letters[i] for i in seen.tolist())
+
+    def columns(self, letters):
+        return self.counts[:, [self.letters.index(c) for c in letters]]
+
+    def first_position(self, i, col):
+        word = self.words[i] if self.case_sensitive else self.words[i].lower()
+        return word.index(self.letters[col])
+
+    def take(self, order):
+        return Words(
+            words=[self.words[i] for i in order.tolist()],
+            letters=self.letters,
+            case_sensitive=self.case_sensitive,
+            **{name: getattr(self, name)[order] for name in self.COLUMNS},
+        )
+
+    def save(self, out):
+        # (StageCache) words as one utf-8 blob and their sizes, the columns as they are
+        encoded = [w.encode("utf-8") for w in self.words]
+        numpy.savez(
+            out,
+            text=numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8),
+            sizes=numpy.fromiter(map(len, encoded), dtype=numpy.int64, count=len(encoded)),
+            letters=numpy.array(self.letters),
+            case_sensitive=numpy.array(self.case_sensitive),
+            **{name: getattr(self, name) for name in self.COLUMNS},
+        )
+
+    @classmethod
+    def load(cls, infile):
+        with numpy.load(infile) as data:
+            text = data["text"].tobytes()
+            ends = numpy.cumsum(data["sizes"]).tolist()
+            words = [text[a:b].decode("utf-8") for a, b in zip([0] + ends, ends)]
+            return cls(
+                words=words,
+                letters=str(data["letters"]),
+                case_sensitive=bool(data["case_sensitive"]),
+                **{name: data[name] for name in cls.COLUMNS},
             )
-            binary = b"".join(toc_tags)
-            binary += struct.pack(self.TOC_TEMPLATE, toc[1], toc[2])
-            out.write(binary)
 
 
 def main():
     args = parse_args()
     print(f"{args=}")
 
-    # read words
-    print("reading input …")
-    words = read_input(args)
+    # base db: its tags and encoding
+    if args.base:
+        args.base_md5 = read_base_manifest(args)["md5"]
 
-    # count letters
+    # stage keys -- a stage is computed from the one before it
+    cache = StageCache(args.cache_dir)
+    cache.key("words", source_digest(args.input, args), stage_options(args, WORDS_OPTIONS))
+    cache.key(
+        "counts", cache.keys["words"], "".join(args.tags or ""), stage_options(args, COUNTS_OPTIONS)
+    )
+
+    def read_words():
+        print("reading input …")
+        return cache.stage("words", lambda: read_input(args), save_json, load_json, "json")
+
+    # read words, count letters
     print("counting letters …")
-    words, letters = count_letters(words, args)
-    max_word_len = max(map(lambda w: w["__len"], words))
+    words = cache.stage("counts", lambda: count_letters(read_words(), args), Words.save, Words.load)
+    letters = words.seen_letters()
+    max_word_len = int(words.length.max())
     print(f"{len(words)=}, {len(letters)=}, {max_word_len=}")
-    print(f"{words[1000]=}")
+    print(f"{words.show(1000)=}")
 
     # reorder tags
     print("reordering tags …")
-    if args.best_tag_order:
-        args.tags = reorder_tags(words, letters)
+    if args.base:
+        print(f"tag order of the base {args.tags=}")
+    elif args.tag_order_from_queries:
+        queries = source_digest(args.tag_order_from_queries, args)
+        cache.key("tags", cache.keys["counts"], "queries", queries)
+        args.tags = cache.stage(
+            "tags",
+            lambda: reorder_tags_by_queries(words, letters, args),
+            save_json,
+            load_json,
+            "json",
+        )
+        print(f"{args.tags=}")
+    elif args.best_tag_order:
+        cache.key("tags", cache.keys["counts"], "dictionary")
+        args.tags = cache.stage(
+            "tags",
+            lambda: reorder_tags_cached(words, letters, args.tag_order_cache),
+            save_json,
+            load_json,
+            "json",
+        )
         print(f"{args.tags=}")
 
     # count ranking and sort for best tag
-    print("counting ranking …")
-    words = count_ranking(words, args.tags)
-    words = sorted(words, key=lambda w: w["__ranking"], reverse=False)
-    print(f"{words[1]=}")
-    print(f"{words[1000]=}")
-    print(f"{words[-1]=}")
+    print(f"counting ranking ({args.sort_order}) …")
+
+    def sort_words():
+        order = SORT_ORDERS[args.sort_order](words, args.tags)
+        if args.sort_order != "ranking":
+            report_sort_order(words, order, args)
+        return order
+
+    cache.key("order", cache.keys["counts"], "".join(args.tags), args.sort_order)
+    order = cache.stage("order", sort_words, save_npy, numpy.load, "npy")
+    words = words.take(order)
+    print(f"{words.show(1)=}")
+    print(f"{words.show(1000)=}")
+    print(f"{words.show(-1)=}")
     show_boxes(words, args)
 
     # compile db
-    print("compiling db …")
-    db = compile_db(words, args)
+    if args.base:
+        print(f"compiling {'delta' if args.delta else 'patched db'} of {args.base} …")
+        db = compile_delta(words, args)
+    else:
+        print("compiling db …")
+        db = compile_db(words, args, cache)
 
     # save db
     print("saving db …")
     save_db(db, args)
 
+    # hot answers, searched on the saved db
+    if args.hot_queries and not args.delta:
+        print("answering hot queries …")
+        section = hot_answers(args)
+        with open(args.output, "r+b") as out:
+            db.add_section(section, out)
+
+    write_manifest(db, args)
+
 
 def save_db(db, args):
     with open(args.output, "wb") as out:
@@ -355,129 +1567,236 @@ def save_db(db, args):
         out.flush()
 
 
-def compile_db(words, args):
-    lines: list[Line] = []
-    for i, word in enumerate(words):
-        tags = [
-            (
-                c.encode(args.encoding, errors="ignore"),
-                word["__counters"].get(c, 0),
-                0,
-            )
-            for c in args.tags
+def make_lines(words, args):
+    tags = [(c.encode(args.encoding, errors="ignore"), 0) for c in args.tags]
+    tags += [
+        ("~".encode(args.encoding, errors="ignore"), 3),  # offensive
+        ("~".encode(args.encoding, errors="ignore"), 1),  # length
+        ("~".encode(args.encoding, errors="ignore"), 2),  # morph
+        ("~".encode(args.encoding, errors="ignore"), 3),  # topo
+        ("~".encode(args.encoding, errors="ignore"), 3),  # nomen
+    ]
+    counts = words.columns(args.tags)
+    empty = counts.sum(axis=1, dtype=numpy.int64) == 0
+    for i in numpy.flatnonzero(empty).tolist():
+        print(f"skipping empty tags set: {i=} {words.words[i]=}")
+    matrix = numpy.column_stack(
+        [
+            counts,
+            numpy.where(words.offensive, 1, 2),
+            numpy.minimum(words.length, 255),
+            words.morph,
+            numpy.where(words.topo, 1, 2),
+            numpy.where(words.nomen, 1, 2),
         ]
-        if sum([t[1] for t in tags]) == 0:
-            print(f"skipping empty tags set: {i=} {word['word']=}")
-            continue
-        tags.append(
-            (
-                "~".encode(args.encoding, errors="ignore"),
-                1 if word["offensive"] else 2,
-                3,
-            )
-        )
-        tags.append(
-            (
-                "~".encode(args.encoding, errors="ignore"),
-                len(word["word"]),
-                1,
+    )[~empty]
+    bodies = [
+        word.encode(args.encoding, errors="ignore")
+        for word, skip in zip(words.words, empty.tolist())
+        if not skip
+    ]
+    return Lines(tags, matrix, bodies, words.score[~empty])
+
+
+def compile_db(words, args, cache=None):
+    lines = make_lines(words, args)
+    for i in range(2, len(lines), 20000):
+        word = lines.bodies[i].decode(args.encoding)
+        print(f"compiling: {i=} {word=} line={lines.show(i)}")
+    cache = cache or StageCache()
+    cache.key(
+        "toc",
+        cache.keys.get("order"),
+        stage_options(args, TOC_OPTIONS),
+        source_digest(args.toc_queries, args) if args.toc_queries else "",
+    )
+    toc = cache.stage(
+        "toc",
+        lambda: make_toc(lines, args),
+        CachedTOC.save,
+        lambda infile: CachedTOC(lines, CachedTOC.load(infile)),
+    )
+    if args.popularity:
+        moved = toc.order_pages()
+        print(f"lines ordered by popularity within pages: {moved=}")
+    db = SlvbrDB(
+        "slovobor",
+        args.encoding,
+        lines,
+        bog_pack=args.bog_pack,
+        toc=toc,
+        sections=make_sections(lines, args),
+        pack=args.pack_lines,
+    )
+    return db
+
+
+MANIFEST_OPTIONS = ("morph", "min_length", "no_topo", "no_nomen", "case_sensitive", "tags_alpha_only")
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024**2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(db, args):
+    # OUTPUT.manifest.json: what a later --base build of it needs to know
+    manifest = {
+        "db": os.path.basename(args.output),
+        "md5": file_md5(args.output),
+        "lines": len(db.lines),
+        "tags": "".join(args.tags),
+        "encoding": args.encoding,
+        "options": {name: getattr(args, name) for name in MANIFEST_OPTIONS},
+        "base": args.base_md5 if args.base else None,
+        "delta": args.delta,
+    }
+    with open(args.output + ".manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    print(f"manifest: {args.output}.manifest.json {manifest['md5']=}")
+
+
+def read_base_manifest(args):
+    path = args.base_manifest or args.base + ".manifest.json"
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["delta"]:
+        raise SystemExit(f"{args.base}: a delta can not be a base")
+    if file_md5(args.base) != manifest["md5"]:
+        raise SystemExit(f"{args.base}: not the db of {path}")
+    differ = {
+        name: (value, getattr(args, name))
+        for name, value in manifest["options"].items()
+        if getattr(args, name) != value
+    }
+    if differ:
+        print(f"base options differ (base, now): {differ}")
+    args.tags, args.encoding = manifest["tags"], manifest["encoding"]
+    return manifest
+
+
+def compile_delta(words, args):
+    # lines of the words vs lines of the base (tags and body, as a multiset):
+    # a patched db -- the kept base lines with their bog and toc pages, the
+    # added ones after them; or a delta db -- the added lines only
+    lines = make_lines(words, args)
+    with SlvbrFile(args.base) as base:
+        tags = [(t.value.encode(args.encoding), t.type) for t in base.tags]
+        if tags != lines.tags:
+            raise SystemExit(f"{args.base}: tags differ from the manifest ones")
+
+        base_tags = numpy.ascontiguousarray(base.tags_matrix)
+        base_keys = [base_tags[i].tobytes() + base.line_bytes(i) for i in range(len(base))]
+        left = Counter(base_keys)
+        added = []
+        for i, body in enumerate(lines.bodies):
+            key = lines.matrix[i].tobytes() + body
+            if left[key] > 0:
+                left[key] -= 1
+            else:
+                added.append(i)
+        keep = numpy.ones(len(base), dtype=bool)
+        for i, key in enumerate(base_keys):
+            if left[key] > 0:
+                left[key] -= 1
+                keep[i] = False
+        added = numpy.array(added, dtype=numpy.intp)
+        removed = numpy.flatnonzero(~keep)
+        print(f"delta: {len(base)=} {len(lines)=} removed={len(removed)} added={len(added)}")
+
+        if args.delta:
+            delta = Lines(
+                lines.tags,
+                lines.matrix[added],
+                [lines.bodies[i] for i in added.tolist()],
+                lines.scores[added],
             )
-        )
-        tags.append(
-            (
-                "~".encode(args.encoding, errors="ignore"),
-                ord(word["morph"][0]),
-                2,
+            return SlvbrDB(
+                f"{base.meta.title} delta",
+                args.encoding,
+                delta,
+                bog_pack=args.bog_pack,
+                toc=PatchTOC(delta, [], 0),
+                sections=[lambda toc: BaseDelta(args.base_md5, removed, len(base))],
             )
+
+        kept = int(keep.sum())
+        patched = Lines(
+            lines.tags,
+            numpy.vstack([base_tags[keep], lines.matrix[added]]),
+            [base.line_bytes(i) for i in numpy.flatnonzero(keep).tolist()]
+            + [lines.bodies[i] for i in added.tolist()],
+            numpy.concatenate([numpy.zeros(kept), lines.scores[added]]),
         )
-        tags.append(
-            (
-                "~".encode(args.encoding, errors="ignore"),
-                1 if word["topo"] else 2,
-                3,
-            )
+        patched.bog_ptr[:kept] = base.bodies[keep]
+        before = numpy.concatenate([[0], numpy.cumsum(keep)])  # kept lines before i
+        pages = []
+        for mins, (start, count) in zip(base.toc_tags.tolist(), base.toc_pages.tolist()):
+            first = int(before[start])
+            pages.append([mins, first, int(before[start + count]) - first])
+        return SlvbrDB(
+            base.meta.title,
+            args.encoding,
+            patched,
+            bog_pack=functools.partial(PatchBog, base_bog=bytes(base.bog), kept=kept),
+            toc=PatchTOC(patched, pages, kept),
+            sections=make_sections(patched, args),
+            pack=args.pack_lines,
         )
-        tags.append(
-            (
-                "~".encode(args.encoding, errors="ignore"),
-                1 if word["nomen"] else 2,
-                3,
-            )
-        )
-        body = word["word"].encode(args.encoding, errors="ignore")
-        line = Line(tags, body)
-        if i % 20000 == 2:
-            print(f"compiling: {i=} {word['word']=} {line=}")
-        lines.append(line)
-    db = SlvbrDB("slovobor", args.encoding, lines)
-    return db
-
-
-def min_line(a, b):
-    assert isinstance(a, list) and isinstance(b, list)
-    assert len(a) == len(b)
-    return [min(a[i], b[i]) for i in range(len(a))]
 
 
 def show_boxes(words, args, index_size=8):
-    current = None
-    tagted = args.tags[:index_size]
-    counters = []
-    for word in words:
-        word_index = [word["__counters"].get(c, 0) for c in tagted]
-        if current is None:
-            current = word_index
-            counter = 1
-        elif current != word_index:
-            # print(f"{current=}, {counter=}, {word['word']=}")
-            counters.append(counter)
-            counter = 1
-            current = word_index
-        else:
-            counter += 1
-    print(f"{current=}, {counter=}, {word['word']=}")
-    counters.append(counter)
+    index = words.columns(args.tags[:index_size])
+    changes = numpy.flatnonzero(numpy.any(index[1:] != index[:-1], axis=1)) + 1
+    counters = numpy.diff(changes, prepend=0, append=len(words)).tolist()
+    current, counter, word = index[-1].tolist(), counters[-1], words.words[-1]
+    print(f"{current=}, {counter=}, {word=}")
     print(f"{median(counters)=}, {mean(counters)=}, {max(counters)=}, {len(counters)=}")
 
 
 def reorder_tags(words, tags):
+    # greedy: pick the letter splitting the still-alive words best, kill the
+    # words having it, repeat; the alive mask and per-letter histograms of
+    # counts are kept between rounds, only the killed words are subtracted
+
+    cols = [words.letters.index(c) for c in tags]
+    counts = words.counts
+    width = int(counts.max(initial=0)) + 1
+    histograms = {
+        col: numpy.bincount(counts[:, col], minlength=width).astype(numpy.int64)
+        for col in cols
+    }
+    holders = {col: numpy.flatnonzero(counts[:, col] > 0).tolist() for col in cols}
+    firsts = {col: 0 for col in cols}
+    alive = numpy.ones(len(words), dtype=bool)
 
     cadidates = []
     for i in range(len(tags)):
-        tag_splits = calculate_tag_splitting(words, cadidates)
-        tag_splits = {
-            k: v
-            for (k, v) in sorted(
-                filter(lambda x: x[0] not in cadidates, tag_splits.items()),
-                key=lambda x: len(x[1]),
-                reverse=True,
-            )
-        }
-        # print(
-        #     f"{'AZ':4s} | {'size':4s} {'total':8s} {'median':8s} {'mean':8s} | {'sizes':8s}"
-        # )
-        best = None
-        totalled = 0
+        tag_splits = []
+        for col in cols:
+            if words.letters[col] in cadidates:
+                continue
+            first, held = firsts[col], holders[col]
+            while first < len(held) and not alive[held[first]]:
+                first += 1
+            firsts[col] = first
+            if first == len(held):
+                continue
+            met = (held[first], words.first_position(held[first], col))
+            sizes = [n for n in histograms[col][1:].tolist() if n > 0]
+            tag_splits.append((met, words.letters[col], sizes))
         if not tag_splits:
             break
-        for letter, lc in tag_splits.items():
-            # print(f"{letter:4s}", end=" | ")
-            counts = sorted(lc.keys())
-            # sizes = [lc[i + 1] for i in range(max(counts))]
-            sizes = [lc[c] for c in counts]
+        tag_splits.sort(key=lambda x: x[0])
+        tag_splits.sort(key=lambda x: len(x[2]), reverse=True)
+
+        best = None
+        totalled = 0
+        for _, letter, sizes in tag_splits:
             totalled += sum(sizes)
-            # print(
-            #     f"{len(sizes):4d} {sum(sizes):8d} {median(sizes):8.0f} {mean(sizes):8.0f}",
-            #     end=" | ",
-            # )
-            # for size in sizes:
-            #     print(f"{size:8d}", end="")
-            # print()
-            # if best is None or len(sizes) > best[1] or median(sizes) > best[5]:
-            # if best is None or sum(sizes) > best[2] or median(sizes) > best[5]:
-            # if best is None or mean(sizes) > best[4]:
-            # if best is None or median(sizes) > best[5]:
-            # if best is None or sum(sizes) > best[2] or median(sizes) > best[5]:
             if best is None or len(sizes) > best[1] or max(sizes) > best[3]:
                 best = (
                     letter,
@@ -490,6 +1809,11 @@ def reorder_tags(words, tags):
         print(f"{best=}, {totalled=}")
         cadidates.append(best[0])
 
+        killed = numpy.flatnonzero(alive & (words.columns(best[0])[:, 0] > 0))
+        alive[killed] = False
+        for col in cols:
+            histograms[col] -= numpy.bincount(counts[killed, col], minlength=width)
+
     for tag in tags:
         if tag not in cadidates:
             cadidates.append(tag)
@@ -497,85 +1821,380 @@ def reorder_tags(words, tags):
     return cadidates
 
 
-def calculate_tag_splitting(words, dead_letters=None):
-    gcounter = defaultdict(lambda: defaultdict(int))
-    for word in words:
-        dead_word = False
-        if dead_letters is not None:
-            for dl in dead_letters:
-                if dl in word["__counters"] and word["__counters"][dl] > 0:
-                    dead_word = True
-                    break
-        if dead_word:
-            continue
-        for letter, counter in word["__counters"].items():
-            gcounter[letter][counter] += 1
-    return gcounter
+def reorder_tags_cached(words, tags, cache_path=None):
+    # the order only depends on the letters and the count matrix
+    digest = hashlib.sha256("".join(tags).encode("utf-8"))
+    digest.update(numpy.ascontiguousarray(words.counts).data)
+    key = digest.hexdigest()
+
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            print(f"tag order from cache {cache_path=} {key=}")
+            return cached["tags"]
+
+    started = time.monotonic()
+    ordered = reorder_tags(words, tags)
+    print(f"tag order in {time.monotonic() - started:.1f}s")
+
+    if cache_path:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "tags": ordered}, f, ensure_ascii=False)
+    return ordered
+
+
+def reorder_tags_by_queries(words, tags, args, page_size=20):
+    # candidate orders -- the given one, the dictionary split (reorder_tags)
+    # and a query-weighted greedy one -- are ranked by the records the toc
+    # prunes for the query sample: the words sorted by the order, cut into
+    # pages, Σ over queries of the lines of pages failing the letter check
+    with open(args.tag_order_from_queries, encoding="utf-8") as infile:
+        queries = [q for q, _, _ in filter(None, map(parse_query_line, infile))]
+    counts = QueryModel.count_letters(queries, tags, args.case_sensitive)
+    print(f"tag order from {len(queries)} queries {args.tag_order_from_queries}")
+
+    candidates = {
+        "given": list(tags),
+        "dictionary": reorder_tags_cached(words, tags, args.tag_order_cache),
+        "queries": reorder_tags_for_queries(words, tags, counts),
+    }
+    best = None
+    for name, order in candidates.items():
+        pruned = toc_pruning(words, tags, order, counts, args, page_size)
+        share = pruned / max(len(queries) * len(words), 1)
+        print(f"tag order {name}: pruned {share * 100:.1f}% {''.join(order)}")
+        if best is None or pruned > best[0]:
+            best = (pruned, name, order)
+    print(f"tag order: {best[1]}")
+    return best[2]
+
+
+def reorder_tags_for_queries(words, tags, counts):
+    # greedy: pick the letter that most often prunes a still-alive word --
+    # (queries without the letter) × (alive words with it), the words having
+    # it are done with, repeat
+    cols = [words.letters.index(c) for c in tags]
+    having = words.counts[:, cols] > 0
+    missing = (counts == 0).sum(axis=0)
+    alive = numpy.ones(len(words), dtype=bool)
+    order = []
+    left = list(range(len(tags)))
+    while left:
+        held = having[alive][:, left].sum(axis=0)
+        gains = missing[left] * held
+        k = left[int(gains.argmax())]
+        if gains.max() == 0:
+            break
+        order.append(k)
+        left.remove(k)
+        alive &= ~having[:, k]
+    order += left
+    return [tags[k] for k in order]
+
+
+def toc_pruning(words, tags, order, counts, args, page_size=20):
+    # counts: (queries × tags) letter counts, in `tags` order
+    ranked = SORT_ORDERS[args.sort_order](words, order)
+    keys = words.columns(tags)[ranked]
+    starts = numpy.arange(0, len(keys), page_size)
+    mins = numpy.minimum.reduceat(keys, starts, axis=0)
+    sizes = numpy.diff(starts, append=len(keys))
+    pruned = 0
+    for chunk in range(0, len(counts), 256):
+        q = counts[chunk : chunk + 256][:, None, :]
+        fails = (mins[None, :, :] > q).any(axis=2)
+        pruned += int((fails * sizes).sum())
+    return pruned
+
+
+INPUT_FLAGS = ("offensive", "topo", "nomen")
+
+# --popularity: input fields a derived score needs, any other name is an
+# input field holding the score itself (frequency, …)
+POPULARITY_FIELDS = {None: (), "length": (), "links": ("syns", "ants")}
+
+JSON_SEPARATORS_RE = re.compile(r"[\s,\[\]]*")
 
 
 def read_input(args):
+    # → columns of the wanted words: word, morph (its first letter), offensive,
+    # topo, nomen (bool), and the input fields --popularity reads
+
+    extra = POPULARITY_FIELDS.get(args.popularity, (args.popularity,))
+    if args.input.endswith(".slvw"):
+        return read_input_columns(args, extra)
+
+    # JSON array or JSON lines, plain / .bz2 / .zst
+    infile = recordio.open_text(args.input)
+
+    words = filter(lambda w: is_wanted(w, args), stream_json(infile))
+    if args.limit:
+        words = itertools.islice(words, args.limit)
+    words = list(words)
+
+    if infile is not sys.stdin:
+        infile.close()
+
+    columns = {
+        "word": [w["word"] for w in words],
+        "morph": [ord(w["morph"][0]) for w in words],
+    }
+    for name in INPUT_FLAGS:
+        columns[name] = [bool(w.get(name)) for w in words]
+    for name in extra:
+        columns[name] = [w.get(name) for w in words]
+    return columns
+
+
+def read_input_columns(args, extra):
+    # .slvw: blocks filtered on their columns, no record is built
+    parts, left = [], args.limit or None
+    for block in recordio.read_columns(args.input, lists=extra):
+        ids = numpy.flatnonzero(wanted_columns(block, args))
+        if left is not None:
+            ids = ids[:left]
+            left -= len(ids)
+        firsts = numpy.zeros(256, dtype=numpy.uint8)
+        firsts[: len(block["morph.abc"])] = [ord(c) for c in block["morph.abc"]]
+        part = {
+            "word": [block["word"][i] for i in ids.tolist()],
+            "morph": firsts[block["morph.first"][ids]],
+        }
+        for name in INPUT_FLAGS:
+            part[name] = block[name][ids]
+        for name in extra:
+            values = block.get(name)
+            part[name] = [values[i] for i in ids.tolist()] if values else [None] * len(ids)
+        parts.append(part)
+        if left == 0:
+            break
 
-    if args.input == "-":
-        infile = sys.stdin
-    elif args.input.endswith(".bz2"):
-        infile = bz2.BZ2File(args.input)
-    else:
-        infile = open(args.input)
+    columns = {"word": [], "morph": []}
+    for name in INPUT_FLAGS + tuple(extra):
+        columns[name] = []
+    for part in parts:
+        for name, values in part.items():
+            columns[name].extend(values.tolist() if isinstance(values, numpy.ndarray) else values)
+    return columns
 
-    words = json.load(infile)
+
+def wanted_columns(block, args):
+    # is_wanted over a .slvw block
+    wanted = numpy.ones(len(block["word"]), dtype=bool)
+    if args.morph:
+        bits = sum(1 << i for i, c in enumerate(block["morph.abc"]) if c in args.morph)
+        wanted &= (block["morph"] & numpy.uint32(bits)) != 0
+    if args.min_length:
+        wanted &= block["length"] >= args.min_length
+    if args.no_topo:
+        wanted &= ~block["topo"]
+    if args.no_nomen:
+        wanted &= ~block["nomen"]
+    return wanted
+
+
+def is_wanted(word, args):
 
     if args.morph:
         # NZ ~ NVA
-        words = filter(
-            lambda w: len(set(w["morph"]).intersection(args.morph)) > 0,
-            words,
-        )
+        if not set(word["morph"]).intersection(args.morph):
+            return False
 
     if args.min_length:
-        words = filter(
-            lambda w: len(w["word"]) >= args.min_length,
-            words,
-        )
+        if len(word["word"]) < args.min_length:
+            return False
 
     if args.no_topo:
-        words = filter(
-            lambda w: not w.get("topo"),
-            words,
-        )
+        if word.get("topo"):
+            return False
 
     if args.no_nomen:
-        words = filter(
-            lambda w: not w.get("nomen"),
-            words,
-        )
-
-    return words if isinstance(words, list) else list(words)
+        if word.get("nomen"):
+            return False
+
+    return True
+
+
+def stream_json(infile, chunk_size=1024**2):
+    """Yield records of a JSON array (or of back-to-back JSON values) one by one,
+    holding no more than a chunk of the input in memory."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    while True:
+        pos = JSON_SEPARATORS_RE.match(buffer, pos).end()
+        if pos == len(buffer) and eof:
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError("need more data", buffer, pos)
+            record, end = decoder.raw_decode(buffer, pos)
+            if end == len(buffer) and not eof:
+                raise json.JSONDecodeError("need more data", buffer, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = infile.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        pos = end
+        yield record
 
 
 def count_letters(words, args):
-
-    letters = set()
-    for i, word in enumerate(words):
-        if i % 20000 == 2:
-            print(f"{i=} {word=}")
-        word["__len"] = len(word["word"])
-        w = word["word"] if args.case_sensitive else word["word"].lower()
-        if args.tags:
-            w = list(filter(lambda c: c in args.tags, w))
-        if args.tags_alpha_only is True:
-            w = list(filter(lambda c: c.isalpha(), w))
-        lcounter = Counter(w)
-        word["__counters"] = lcounter
-        letters.update(w)
-
-    return words, letters
+    # words: read_input columns
+    texts = words["word"] if args.case_sensitive else [w.lower() for w in words["word"]]
+    for i in range(2, len(texts), 20000):
+        print(f"{i=} {words['word'][i]=} {chr(words['morph'][i])=}")
+
+    joined = "".join(texts)
+    codes = numpy.frombuffer(joined.encode("utf-32-le"), dtype="<u4")
+    sizes = numpy.fromiter(map(len, texts), dtype=numpy.int64, count=len(texts))
+    owners = numpy.repeat(numpy.arange(len(texts)), sizes)
+
+    if args.tags:
+        alphabet = "".join(dict.fromkeys(args.tags))
+    else:
+        alphabet = "".join(sorted(set(joined)))
+    if args.tags_alpha_only is True:
+        alphabet_cols = [c for c in alphabet if c.isalpha()]
+    else:
+        alphabet_cols = list(alphabet)
+
+    lookup = numpy.full(int(codes.max(initial=0)) + 1, -1, dtype=numpy.int64)
+    for c in alphabet_cols:
+        if ord(c) < len(lookup):
+            lookup[ord(c)] = alphabet.index(c)
+    cols = lookup[codes]
+    owners, cols = owners[cols >= 0], cols[cols >= 0]
+    counts = numpy.bincount(
+        owners * len(alphabet) + cols, minlength=len(texts) * len(alphabet)
+    ).reshape(len(texts), len(alphabet))
+    assert counts.max(initial=0) <= 255, f"{counts.max()=}"
+
+    return Words(
+        words=list(words["word"]),
+        letters=alphabet,
+        counts=counts.astype(numpy.uint8),
+        length=numpy.fromiter(map(len, words["word"]), dtype=numpy.int64, count=len(texts)),
+        morph=numpy.asarray(words["morph"], dtype=numpy.uint8).reshape(len(texts)),
+        offensive=numpy.asarray(words["offensive"], dtype=bool).reshape(len(texts)),
+        topo=numpy.asarray(words["topo"], dtype=bool).reshape(len(texts)),
+        nomen=numpy.asarray(words["nomen"], dtype=bool).reshape(len(texts)),
+        score=popularity(words, args),
+        case_sensitive=args.case_sensitive,
+    )
+
+
+def popularity(words, args):
+    # length: longer first; links: synonyms and antonyms, given and got
+    # (the words linking to this one); field: the value of the input field
+    if args.popularity is None:
+        return numpy.zeros(len(words["word"]))
+    if args.popularity == "length":
+        return numpy.fromiter(map(len, words["word"]), dtype=numpy.float64)
+    if args.popularity == "links":
+        links = [
+            set(syns or []) | set(ants or []) for syns, ants in zip(words["syns"], words["ants"])
+        ]
+        linked = defaultdict(int)
+        for others in links:
+            for other in others:
+                linked[other] += 1
+        return numpy.fromiter(
+            (
+                len(syns or []) + len(ants or []) + linked[word]
+                for word, syns, ants in zip(words["word"], words["syns"], words["ants"])
+            ),
+            dtype=numpy.float64,
+        )
+    return numpy.fromiter(
+        (float(v or 0) for v in words[args.popularity]), dtype=numpy.float64
+    )
 
 
 def count_ranking(words, letters):
-    for i, word in enumerate(words):
-        lc = word["__counters"]
-        word["__ranking"] = [lc.get(c, 0) for c in letters] + [word["__len"]]
-    return words
+    # order of words by per-letter counts (in `letters` order), then length
+    keys = words.columns(letters)
+    return numpy.lexsort((words.length, *reversed(keys.T)))
+
+
+def count_zorder(words, letters):
+    # Z-order (Morton) of the count vectors: bit planes from the top one
+    # down, letters in `letters` order within a plane, then length
+    keys = words.columns(letters)
+    planes = []
+    for bit in reversed(range(int(keys.max(initial=0)).bit_length())):
+        planes.extend((keys >> bit & 1).T)
+    return numpy.lexsort((words.length, *reversed(planes)))
+
+
+def count_hilbert(words, letters):
+    # Hilbert curve order of the count vectors (Skilling's transpose, all
+    # words at once), then length
+    keys = words.columns(letters).astype(numpy.int64)
+    bits = max(int(keys.max(initial=0)).bit_length(), 1)
+    x = keys.copy()
+    q = 1 << (bits - 1)
+    while q > 1:
+        p = q - 1
+        for i in range(x.shape[1]):
+            high = (x[:, i] & q) != 0
+            x[high, 0] ^= p
+            swap = (x[~high, 0] ^ x[~high, i]) & p
+            x[~high, 0] ^= swap
+            x[~high, i] ^= swap
+        q >>= 1
+    for i in range(1, x.shape[1]):
+        x[:, i] ^= x[:, i - 1]
+    t = numpy.zeros(len(x), dtype=numpy.int64)
+    q = 1 << (bits - 1)
+    while q > 1:
+        t[(x[:, -1] & q) != 0] ^= q - 1
+        q >>= 1
+    x ^= t[:, None]
+    planes = []
+    for bit in reversed(range(bits)):
+        planes.extend((x >> bit & 1).T)
+    return numpy.lexsort((words.length, *reversed(planes)))
+
+
+SORT_ORDERS = {"ranking": count_ranking, "zorder": count_zorder, "hilbert": count_hilbert}
+
+
+def report_sort_order(words, order, args, leading=4):
+    # ranking vs the chosen order on the fixed toc: pages, pages per letter
+    # tag with a minimum > 0 (the leading tags and the others), and the
+    # expected scan per query of the query model
+    orders = {"ranking": count_ranking(words, args.tags), args.sort_order: order}
+    model = None
+    rows = []
+    for name, taken in orders.items():
+        lines = make_lines(words.take(taken), args)
+        if model is None:
+            model = QueryModel(lines, sample_queries(lines, args, size=2000))
+        toc = TOC(lines)
+        mins = toc.tags_matrix()[:, model.letters]
+        bound = (mins > 0).mean(axis=0)
+        rows.append(
+            (
+                name,
+                toc.count,
+                float(bound[:leading].mean()),
+                float(bound[leading:].mean()),
+                float(mins.sum(axis=1).mean()),
+                model.expected_cost(toc.toc),
+            )
+        )
+    print(
+        f"sort order report ({model.size} queries): pages, bound tags "
+        f"(first {leading} / others), mean page letters minimum, expected scan"
+    )
+    for name, pages, first, others, letters, cost in rows:
+        print(
+            f"  {name:<8} pages={pages} bound={first:.3f}/{others:.3f} "
+            f"letters={letters:.2f} scan={cost:.1f}"
+        )
 
 
 def parse_args():
@@ -590,10 +2209,70 @@ def parse_args():
     parser.add_argument("--tags-language", "-tl", type=str, default=None)
     parser.add_argument("--tags-alpha-only", "-tao", action="store_true")
     parser.add_argument("--best-tag-order", "-bfo", action="store_true")
+    parser.add_argument("--tag-order-cache", "-toc", type=str, default=None)
+    parser.add_argument(
+        "--tag-order-from-queries", "-toq", type=str, default=None, help="query sample file"
+    )
     parser.add_argument("--encoding", "-e", type=str, default="utf-8")
     parser.add_argument("--min-length", "-ml", type=int, default=0)
     parser.add_argument("--limit", "-l", type=int, default=0)
+    parser.add_argument(
+        "--bog-pack", "-bp", choices=list(BOG_PACKERS), default="dedup"
+    )
+    parser.add_argument(
+        "--popularity",
+        "-pop",
+        type=str,
+        default=None,
+        help="order lines within toc pages by: length, links or an input field",
+    )
+    parser.add_argument(
+        "--sort-order", "-so", choices=list(SORT_ORDERS), default="ranking"
+    )
+    parser.add_argument(
+        "--toc-strategy", "-ts", choices=["fixed", "cost"], default="fixed"
+    )
+    parser.add_argument(
+        "--toc-queries", "-tq", type=str, default=None, help="query sample file"
+    )
+    parser.add_argument("--toc-max-page", type=int, default=48)
+    parser.add_argument(
+        "--super-toc", "-st", type=int, default=0, help="K toc pages per super page (v2)"
+    )
+    parser.add_argument(
+        "--page-summary", "-ps", action="store_true", help="toc page summaries (v2)"
+    )
+    parser.add_argument(
+        "--tag-maxima", "-tm", action="store_true", help="per-tag maxima (v2)"
+    )
+    parser.add_argument(
+        "--hot-queries", "-hq", type=str, default=None, help="query log, answers (v2)"
+    )
+    parser.add_argument("--hot-count", type=int, default=10000)
+    # backend rsp-limit and rsp-min
+    parser.add_argument("--hot-limit", type=int, default=1000)
+    parser.add_argument("--hot-min-length", type=int, default=3)
+    parser.add_argument(
+        "--bitset-index", "-bi", action="store_true", help="letter count bitmaps (v2)"
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=None, help="stage cache: words, counts, tags, order, toc"
+    )
+    parser.add_argument(
+        "--base", type=str, default=None, help="previous build to patch (or --delta)"
+    )
+    parser.add_argument(
+        "--base-manifest", type=str, default=None, help="default: BASE.manifest.json"
+    )
+    parser.add_argument(
+        "--delta", action="store_true", help="write a delta of --base, not a patched db"
+    )
+    parser.add_argument(
+        "--pack-lines", "-pl", action="store_true", help="nibble-packed records (v3, python only)"
+    )
     args = parser.parse_args()
+    if args.delta and not args.base:
+        parser.error("--delta needs --base")
 
     if args.tags_language is not None:
         data = LocaleData(args.tags_language)
@@ -1,9 +1,12 @@
 import bz2
-import json
+import os
 import re
 import sys
 import xml.sax
 import argparse
+from multiprocessing import Pool
+
+from recordio import CODECS, RecordsWriter, read_records
 
 whends_re = re.compile(r"(^[\s\n\r]+|[\s\n\r]+$)", re.I | re.U | re.M)
 whends0_re = re.compile(r"(^[\s\n\r]+)|([\s\n\r]+$)", re.I | re.U)
@@ -51,21 +54,81 @@ MEANING_RE = re.compile(
 )
 
 
+class MorphClassifier:
+    """Finds all morphology markers of a section in one regex pass.
+
+    Returns (morph, topo, nomen): morph letters in MORPH_ORDER (each once),
+    topo -- {{топоним/{{гидроним seen, nomen -- {{собств. seen.
+    """
+
+    MORPH_ORDER = "NVA9DRPZSTBFJO"
+
+    # letters: template name patterns after "\n{{\s*" (%(lang)s -- language)
+    MARKERS = (
+        ("N", r"сущ[\- ]+%(lang)s|падежи(?=\s*\n)"),
+        ("V", r"гл[\- ]+%(lang)s"),
+        ("A", r"прил[\- ]+%(lang)s|Мс-п6"),
+        ("9", r"числ[\- ]+"),
+        ("DR", r"adv[\- ]+%(lang)s"),
+        ("R", r"(?:predic|conj)[\- ]+%(lang)s"),
+        ("P", r"(?:прич|деепр)[\- ]+"),
+        ("Z", r"мест[\- ]+"),
+        ("S", r"prep[\- ]+"),
+        ("T", r"(?:intro|part)[\- ]+"),
+        ("B", r"abbrev"),
+        ("F", r"(?-i:Фам)[\- ]+"),
+        ("J", r"interj[\- ]+"),
+        ("O", r"onomatop[\- ]+"),
+    )
+
+    def __init__(self, lang):
+        markers = "|".join(
+            "(?P<m%d>%s)" % (i, rx % {"lang": re.escape(lang)})
+            for i, (_, rx) in enumerate(self.MARKERS)
+        )
+        self.regex = re.compile(
+            r"\n{{\s*(?:%s)|{{(?-i:(?P<topo>топоним|гидроним)|(?P<nomen>собств\.))"
+            % markers,
+            re.I | re.M,
+        )
+        self.letters = {"m%d" % i: m for i, (m, _) in enumerate(self.MARKERS)}
+
+    def __call__(self, text):
+        found = set()
+        for mo in self.regex.finditer(text):
+            found.add(mo.lastgroup)
+        letters = set()
+        for group in found:
+            letters.update(self.letters.get(group, ""))
+        morph = "".join(m for m in self.MORPH_ORDER if m in letters)
+        return morph, "topo" in found, "nomen" in found
+
+
 class WikiReader(xml.sax.handler.ContentHandler):
 
+    # only these elements of a page are buffered, everything else
+    # (contributor, comment, sha1, …) is dropped as it streams by
+    COLLECT = ("title", "ns", "text")
+
     def __init__(self, **kwargs):
         self.mode = None
         self.level = 0
         self.levels = []
         self.pages = 0
         self.texts = {}
+        self.skip = False
+        self.skip_pages = 0  # already done by the resumed run
         self.output = []
+        self.writer = None  # records go to the writer (or to self.output)
+        self.collected = 0
         self.lang = kwargs.get("lang", "ru")
         self.uniques = set()
 
     def startElement(self, name, attrs):
         self.level += 1
         self.levels.append(name)
+        if name == "page" and self.pages < self.skip_pages:
+            self.skip = True
 
     def endElement(self, name):
         self.level -= 1
@@ -74,28 +137,66 @@ class WikiReader(xml.sax.handler.ContentHandler):
             self.mode = None
             self.levels = []
             self.pages += 1
-            data = self.process_page()
+            data = None if self.skip else self.process_page()
             if data:
-                if data["word"] in self.uniques:
-                    print(f"#! DUP: {data['word']}", file=sys.stderr)
-                self.uniques.add(data["word"])
-                # if data["offensive"]:
-                #     print(f"!OFF: {data['word']} {data['syns']}", file=sys.stderr)
-                if len(self.output) % 1000 == 1:
-                    print(f"#~ {len(self.output)}/{self.pages}: {data}", file=sys.stderr)
-                self.output.append(data)
+                self.collect(data)
             self.texts = {}
+            self.skip = False
+            if self.writer and self.pages % self.writer.checkpoint_every == 0:
+                self.writer.checkpoint(pages=self.pages)
 
         elif self.levels:
             self.levels.pop()
+            if name in self.COLLECT and not self.skip:
+                self.skip = not self.want_page(name)
+
+    def collect(self, data):
+        if data["word"] in self.uniques:
+            print(f"#! DUP: {data['word']}", file=sys.stderr)
+        self.uniques.add(data["word"])
+        # if data["offensive"]:
+        #     print(f"!OFF: {data['word']} {data['syns']}", file=sys.stderr)
+        self.collected += 1
+        if self.collected % 1000 == 1:
+            print(f"#~ {self.collected}/{self.pages}: {data}", file=sys.stderr)
+        if self.writer:
+            self.writer.write(data)
+        else:
+            self.output.append(data)
+
+    def resume(self, writer):
+        # continue the interrupted run: same records, same uniques, same pages
+        self.writer = writer
+        if writer.state:
+            self.uniques.update(r["word"] for r in read_records(writer.name))
+            self.collected = writer.records
+            self.skip_pages = writer.state["pages"]
+            print(
+                f"wiki: resuming after {self.skip_pages} pages, "
+                f"{self.collected} records",
+                file=sys.stderr,
+            )
 
     def characters(self, content):
-        if self.levels:
+        if self.levels and not self.skip:
             name = self.levels[-1]
-            if name not in self.texts:
-                self.texts[name] = [content]
-            else:
-                self.texts[name].append(content)
+            if name not in self.COLLECT:
+                return
+            self.take(name, content)
+
+    def take(self, name, content):
+        # a chunk of collected element `name` of the page
+        if name not in self.texts:
+            self.texts[name] = [content]
+        else:
+            self.texts[name].append(content)
+
+    def want_page(self, name):
+        # called as soon as element `name` of a page is read,
+        # False drops the rest of the page unbuffered
+        if name == "ns":
+            return "".join(self.texts.get("ns", [])).strip() in ("", "0")
+        return True
 
     def process_page(self):
         return None
@@ -107,29 +208,82 @@ class RUWikiReader(WikiReader):
     # {{-ru-}} -- начало блока для языка
     PAGE_LANG_BLOCK_SPLIT_RE = re.compile(r"^=\s+{{-([a-z]+)-}}\s+=$", re.I | re.M)
 
-    def get_lang_block(self, text, lang):
-        start, end = 0, len(text)
-        while True:
-            mo = self.PAGE_LANG_BLOCK_SPLIT_RE.search(text, start)
-            if not mo:
-                return None
-            start = mo.end(0)
-            if mo.group(1) == lang:
+    # <text> chunks (a line or less each) are scanned for headers every
+    # PENDING chunks: the part before the language header is dropped, the
+    # part after the block is not buffered at all; a header split between
+    # scans is matched in the kept tail, it starts at a line start no more
+    # than HEADER_TAIL chars back
+    PENDING = 256
+    HEADER_TAIL = 256
+
+    # <text> is read as BEFORE (dropped) the language header, IN the
+    # language block (buffered) and AFTER it (dropped, the next header seen)
+    BEFORE, IN, AFTER = 0, 1, 2
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.classify_morph = MorphClassifier(self.lang)
+        self.block = self.BEFORE
+        self.pending = []
+
+    def take(self, name, content):
+        if name != "text":
+            super().take(name, content)
+        elif self.block != self.AFTER:
+            self.pending.append(content)
+            if len(self.pending) >= self.PENDING:
+                self.take_lang_block()
+
+    def take_lang_block(self, final=False):
+        # pending <text> is read from a line start (or from the end of the
+        # language header), its language block part goes to self.texts;
+        # a header up to the pending end waits for more chunks (`$` unsure)
+        text = "".join(self.pending)
+        self.pending = []
+        pos = 0
+        while mo := self.PAGE_LANG_BLOCK_SPLIT_RE.search(text, pos):
+            if mo.end(0) == len(text) and not final:
                 break
-        mo = self.PAGE_LANG_BLOCK_SPLIT_RE.search(text, start)
-        if mo:
-            end = mo.start(0)
-        return text[start:end]
+            if self.block == self.IN:
+                # the next language, the rest of the text is not buffered
+                self.texts.setdefault("text", []).append(text[: mo.start(0)])
+                self.block = self.AFTER
+                return
+            pos = mo.end(0)
+            if mo.group(1) == self.lang:
+                self.block = self.IN
+                text, pos = text[pos:], 0
+
+        if final:
+            cut = len(text)
+        elif mo:
+            cut = mo.start(0)
+        else:
+            cut = text.rfind("\n", 0, max(pos, len(text) - self.HEADER_TAIL)) + 1
+        if self.block == self.IN and cut:
+            self.texts.setdefault("text", []).append(text[:cut])
+        if cut < len(text):
+            self.pending = [text[cut:]]
+
+    def want_page(self, name):
+        if name == "title":
+            return not spsymbs_re.search(sstrip("".join(self.texts.get("title", []))))
+        if name == "text":
+            # the rest of the language block, the header may end the text
+            if self.block != self.AFTER:
+                self.take_lang_block(final=True)
+            self.block = self.BEFORE
+            return True
+        return super().want_page(name)
 
     def process_page(self):
 
         title = sstrip("".join(self.texts.get("title", [])))
-        text = "".join(self.texts.get("text", []))
+        text = "".join(self.texts.get("text", []))  # the language block only
 
         if spsymbs_re.search(title):
             return None
 
-        text = self.get_lang_block(text, self.lang)
         if not text:
             return None
 
@@ -137,51 +291,9 @@ class RUWikiReader(WikiReader):
         morph, topo, nomen = "", None, None
 
         for mo in MORPH_RE.finditer(text):  # слово одно -- смыслов несколько
-            mrph_txt = mo.group(1)
-            if (
-                re.search(r"\n{{\s*сущ[\- ]+" + self.lang, mrph_txt, re.I | re.M)
-                or re.search(r"\n{{\s*падежи\s*\n", mrph_txt, re.I | re.M)
-                or False
-            ):
-                morph += "N"
-            if re.search(r"\n{{\s*гл[\- ]+" + self.lang, mrph_txt, re.I | re.M):
-                morph += "V"
-            if (
-                re.search(r"\n{{\s*прил[\- ]+" + self.lang, mrph_txt, re.I | re.M)
-                or re.search(r"\n{{\s*Мс-п6", mrph_txt, re.I | re.M)
-                or False
-            ):
-                morph += "A"
-            if re.search(r"\n{{\s*числ[\- ]+", mrph_txt, re.I | re.M):
-                morph += "9"
-            if re.search(r"\n{{\s*adv[\- ]+" + self.lang, mrph_txt, re.I | re.M):
-                morph += "D"
-            if re.search(
-                r"\n{{\s*(adv|predic|conj)[\- ]+" + self.lang, mrph_txt, re.I | re.M
-            ):
-                morph += "R"
-            if re.search(r"\n{{\s*(прич|деепр)[\- ]+", mrph_txt, re.I | re.M):
-                morph += "P"
-            if re.search(r"\n{{\s*мест[\- ]+", mrph_txt, re.I | re.M):
-                morph += "Z"
-            if re.search(r"\n{{\s*prep[\- ]+", mrph_txt, re.I | re.M):
-                morph += "S"
-            if re.search(r"\n{{\s*(intro|part)[\- ]+", mrph_txt, re.I | re.M):
-                morph += "T"
-            if re.search(r"\n{{\s*abbrev", mrph_txt, re.I | re.M):
-                morph += "B"
-            if re.search(r"\n{{\s*Фам[\- ]+", mrph_txt, re.M):
-                morph += "F"
-            if re.search(r"\n{{\s*interj[\- ]+", mrph_txt, re.I | re.M):
-                morph += "J"
-            if re.search(r"\n{{\s*onomatop[\- ]+", mrph_txt, re.I | re.M):
-                morph += "O"
-            topo = mrph_txt.find("{{топоним") >= 0 or mrph_txt.find("{{гидроним") >= 0
-            nomen = (
-                mrph_txt.find("{{собств.") >= 0
-                or "B" not in morph
-                and title[0].isupper()
-            )
+            mrph, topo, nomen = self.classify_morph(mo.group(1))
+            morph += mrph
+            nomen = nomen or "B" not in morph and title[0].isupper()
 
         # неизвестная фигня
         if not morph or morph == "F":
@@ -241,18 +353,97 @@ class ENWikiReader(WikiReader):
         return {}
 
 
-def save_output(fn="data.json", output=None):
-    f = open(fn, "w")
-    f.write(json.dumps(output, indent=0, ensure_ascii=False))
-    f.close()
+# multistream dump := bz2 streams of ~100 <page>s each, every stream can be
+# decompressed on its own; stream offsets are listed in the dump index
+# (offset:page_id:title), or found by the stream header magic
+
+BZ2_STREAM_MAGIC = b"BZh91AY&SY"
+
+
+def find_streams(infile_name, index_name=None):
+    offsets = set()
+    if index_name and os.path.exists(index_name):
+        with bz2.open(index_name, "rt", encoding="utf-8") as index:
+            for line in index:
+                offsets.add(int(line.partition(":")[0]))
+    else:
+        with open(infile_name, "rb") as infile:
+            tail, base = b"", 0
+            while chunk := infile.read(16 * 1024**2):
+                data = tail + chunk
+                pos = data.find(BZ2_STREAM_MAGIC)
+                while pos >= 0:
+                    offsets.add(base - len(tail) + pos)
+                    pos = data.find(BZ2_STREAM_MAGIC, pos + 1)
+                tail = data[-len(BZ2_STREAM_MAGIC) + 1 :]
+                base += len(chunk)
+    offsets.add(0)
+    return sorted(offsets)
+
+
+def split_streams(infile_name, offsets, block_size):
+    # group neighbour streams into (start, end) blocks of ~block_size bytes
+    blocks = []
+    size = os.path.getsize(infile_name)
+    start = 0
+    for offset in offsets[1:] + [size]:
+        if offset - start >= block_size or offset == size:
+            blocks.append((start, offset))
+            start = offset
+    return blocks
+
+
+def parse_block(task):
+    infile_name, start, end, lang = task
+    with open(infile_name, "rb") as infile:
+        infile.seek(start)
+        xml_data = bz2.decompress(infile.read(end - start))
+    first, last = xml_data.find(b"<page>"), xml_data.rfind(b"</page>")
+    wiki = RUWikiReader(lang=lang)
+    wiki.collect = wiki.output.append
+    if first >= 0 and last >= 0:
+        xml_data = b"<pages>" + xml_data[first : last + len(b"</page>")] + b"</pages>"
+        xml.sax.parseString(xml_data, wiki)
+    return wiki.pages, wiki.output
+
+
+def parse_parallel(wiki, infile_name, args):
+    index_name = args.index or infile_name.replace(".xml.bz2", "-index.txt.bz2")
+    offsets = find_streams(infile_name, index_name)
+    blocks = split_streams(infile_name, offsets, args.block_size)
+    print(
+        f"wiki: {len(offsets)} streams in {len(blocks)} blocks, {args.jobs} jobs",
+        file=sys.stderr,
+    )
+    if wiki.skip_pages:
+        if "offset" not in wiki.writer.state:
+            raise SystemExit("wiki: checkpoint has no stream offset, resume with -j 1")
+        blocks = [b for b in blocks if b[0] >= wiki.writer.state["offset"]]
+        wiki.pages = wiki.skip_pages
+    tasks = ((infile_name, start, end, wiki.lang) for start, end in blocks)
+    committed = wiki.pages
+    with Pool(args.jobs) as pool:
+        for (_, end), (pages, output) in zip(blocks, pool.imap(parse_block, tasks)):
+            wiki.pages += pages
+            for data in output:
+                wiki.collect(data)
+            if wiki.pages - committed >= wiki.writer.checkpoint_every:
+                wiki.writer.checkpoint(pages=wiki.pages, offset=end)
+                committed = wiki.pages
 
 
 def main():
 
-    parser = argparse.ArgumentParser(description="Parse RUWiktionary XML dump to JSON.")
+    parser = argparse.ArgumentParser(description="Parse RUWiktionary XML dump to JSON lines (or .slvw columns).")
     parser.add_argument("input", default="-", nargs="?")
-    parser.add_argument("output", default="data-done.json", nargs="?")
+    parser.add_argument("output", default="data-done.jsonl", nargs="?")
     parser.add_argument("--lang", default="ru")
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--block-size", type=int, default=1024**2)
+    parser.add_argument("--checkpoint-every", type=int, default=10000, help="pages")
+    parser.add_argument("--resume", action="store_true", help="from <output>.ckpt")
+    parser.add_argument("--codec", choices=list(CODECS), default=None, help=".slvw columns")
     args = parser.parse_args()
 
     infile_name = args.input
@@ -265,13 +456,26 @@ def main():
             infile = open(infile_name)
 
     outfile_name = args.output
-    print("wiki → json: (%s)→(%s)" % (infile, outfile_name), file=sys.stderr)
-
+    print("wiki → jsonl: (%s)→(%s)" % (infile, outfile_name), file=sys.stderr)
+
+    writer = RecordsWriter(
+        outfile_name,
+        args.checkpoint_every,
+        resume=args.resume,
+        source=infile_name,
+        codec=CODECS.get(args.codec),
+    )
     wiki = RUWikiReader(lang=args.lang)
-    parser = xml.sax.make_parser()
-    parser.setContentHandler(wiki)
-    parser.parse(infile)
-    save_output(outfile_name, wiki.output)
+    wiki.resume(writer)
+    if args.jobs > 1 and infile_name.endswith(".bz2"):
+        infile.close()
+        parse_parallel(wiki, infile_name, args)
+    else:
+        parser = xml.sax.make_parser()
+        parser.setContentHandler(wiki)
+        parser.parse(infile)
+    writer.close()
+    print(f"wiki: {wiki.pages} pages, {writer.records} records", file=sys.stderr)
 
 
 if __name__ == "__main__":
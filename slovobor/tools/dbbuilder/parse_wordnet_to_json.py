@@ -1,10 +1,11 @@
 import copy
 import os
-import json
 import argparse
 from collections import defaultdict
 import re
 
+from recordio import CODECS, RecordsWriter
+
 
 def parse_words_from_data_file(dfile):
     """
@@ -80,14 +81,19 @@ def parse_wordnet_to_json(args):
     wn_data = [copy.copy(v) for v in wn_data.values()]
     wn_data.sort(key=lambda x: x["word"])
 
-    with open(args.output, "w") as json_file:
-        json.dump(wn_data, json_file, indent=2, sort_keys=True, ensure_ascii=False)
+    # JSON lines (.bz2/.zst -- compressed) or columns (.slvw), no checkpoints:
+    # it takes seconds
+    writer = RecordsWriter(args.output, codec=CODECS.get(args.codec))
+    for word_data in wn_data:
+        writer.write(dict(sorted(word_data.items())))
+    writer.close()
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Parse WordNet data to JSON format.")
+    parser = argparse.ArgumentParser(description="Parse WordNet data to JSON lines (or .slvw columns).")
     parser.add_argument("wordnet_base", type=str)
     parser.add_argument("output", type=str)
+    parser.add_argument("--codec", choices=list(CODECS), default=None, help=".slvw columns")
     args = parser.parse_args()
 
     parse_wordnet_to_json(args)
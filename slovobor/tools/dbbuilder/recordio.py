@@ -0,0 +1,317 @@
+"""
+Parsed words files: JSON lines, one record per line, plain or compressed on the
+fly by the file name extension (.bz2, .zst -- needs `zstandard` installed);
+or .slvw -- the same records in columns, binary (see encode_block).
+
+RecordsWriter commits the output with checkpoints (`<output>.ckpt`): a compressed
+stream/frame is closed, the file is synced and its size is saved along with the
+parser position, so an interrupted run can cut the output back to the last
+checkpoint and carry on from there.
+"""
+
+import bz2
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+
+import numpy
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def need_zstandard(name):
+    if zstandard is None:
+        raise SystemExit(f"{name}: zstd needs `zstandard` (pip install zstandard)")
+
+
+def open_text(name):
+    """text (utf-8) reader of a plain, .bz2 or .zst file, or stdin (-)"""
+    if name == "-":
+        return sys.stdin
+    if name.endswith(".bz2"):
+        return io.TextIOWrapper(bz2.BZ2File(name), encoding="utf-8")
+    if name.endswith(".zst"):
+        need_zstandard(name)
+        raw = zstandard.ZstdDecompressor().stream_reader(
+            open(name, "rb"), read_across_frames=True
+        )
+        return io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8")
+    return open(name, encoding="utf-8")
+
+
+def read_records(name):
+    if name.endswith(".slvw"):
+        yield from read_columns_records(name)
+        return
+    with open_text(name) as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+# .slvw := BLOCK … -- one block per commit (checkpoint) of RecordsWriter
+# BLOCK := MAGIC "!slvWB" (6b) + VERSION (uint16, 2b) + COUNT (uint32, 4b)
+#   + COLUMNS_COUNT (uint32, 4b) + COLUMNS_COUNT × COLUMN + the columns data
+# COLUMN := NAME (16b) + CODEC (uint32, 4b) + SIZE (uint32, 4b) + RAW_SIZE (uint32, 4b)
+#   CODEC := 0 raw | 1 zlib | 2 zstd -- a raw column is read in place from
+#   the mapped file (--codec raw), a compressed one is decompressed
+# columns, COUNT records each:
+#   word.off (COUNT+1 × uint32) + word.txt (utf-8) -- string table of the words
+#   morph (uint32) -- bit k: letter k of morph.abc (utf-8, sorted) is in the
+#     morph; morph.first (uint8) -- index of its first letter, 255 -- none
+#   offensive, topo, nomen -- bits (lowest first) of the truthy values
+#   syns.idx (COUNT+1 × uint32, into the items) + syns.off (ITEMS+1 × uint32)
+#     + syns.txt (utf-8), same for ants -- only if the records have them
+# a record read back: the morph letters are its first one and then the rest
+# in alphabet order, flags are True / False, other fields are not kept
+
+SLVW_MAGIC = b"!slvWB"
+SLVW_VERSION = 1
+SLVW_HEAD = "<6sHII"
+SLVW_COLUMN = "<16sIII"
+RAW, ZLIB, ZSTD = 0, 1, 2
+CODECS = {"raw": RAW, "zlib": ZLIB, "zstd": ZSTD}
+SLVW_FLAGS = ("offensive", "topo", "nomen")
+SLVW_LISTS = ("syns", "ants")
+SLVW_RAW_BELOW = 64  # columns this short are not worth a codec
+NO_MORPH = 255
+
+
+def default_codec():
+    return ZSTD if zstandard is not None else ZLIB
+
+
+def string_table(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype="<u4")
+    numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets.tobytes(), b"".join(encoded)
+
+
+def strings(offsets, text):
+    # one decode of the whole table, then the strings cut at character
+    # offsets (utf-8 bytes that do not continue a character, counted)
+    text = numpy.frombuffer(text, dtype=numpy.uint8)
+    starts = numpy.zeros(len(text) + 1, dtype=numpy.int64)
+    numpy.cumsum((text & 0xC0) != 0x80, out=starts[1:])
+    chars = starts[offsets.astype(numpy.intp)]
+    decoded = text.tobytes().decode("utf-8")
+    bounds = chars.tolist()
+    return [decoded[a:b] for a, b in zip(bounds, bounds[1:])], numpy.diff(chars)
+
+
+def encode_block(records, codec=None):
+    codec = default_codec() if codec is None else codec
+    columns = {}
+    columns["word.off"], columns["word.txt"] = string_table([r["word"] or "" for r in records])
+
+    morphs = [r.get("morph") or "" for r in records]
+    abc = sorted(set("".join(morphs)))
+    if len(abc) > 32:
+        raise ValueError(f"slvw: over 32 morph letters {''.join(abc)}")
+    index = {c: i for i, c in enumerate(abc)}
+    columns["morph.abc"] = "".join(abc).encode("utf-8")
+    columns["morph"] = numpy.array(
+        [sum(1 << index[c] for c in set(m)) for m in morphs], dtype="<u4"
+    ).tobytes()
+    columns["morph.first"] = numpy.array(
+        [index[m[0]] if m else NO_MORPH for m in morphs], dtype=numpy.uint8
+    ).tobytes()
+
+    for name in SLVW_FLAGS:
+        flags = numpy.array([bool(r.get(name)) for r in records], dtype=bool)
+        columns[name] = numpy.packbits(flags, bitorder="little").tobytes()
+
+    for name in SLVW_LISTS:
+        if not any(name in r for r in records):
+            continue
+        lists = [r.get(name) or [] for r in records]
+        items = numpy.zeros(len(lists) + 1, dtype="<u4")
+        numpy.cumsum([len(x) for x in lists], out=items[1:])
+        columns[name + ".idx"] = items.tobytes()
+        columns[name + ".off"], columns[name + ".txt"] = string_table(
+            [item for x in lists for item in x]
+        )
+
+    head, data = [], []
+    for name, raw in columns.items():
+        kind = codec if len(raw) >= SLVW_RAW_BELOW else RAW
+        if kind == ZSTD:
+            need_zstandard(name)
+            packed = zstandard.ZstdCompressor().compress(raw)
+        elif kind == ZLIB:
+            packed = zlib.compress(raw)
+        else:
+            packed = raw
+        head.append(struct.pack(SLVW_COLUMN, name.encode("ascii"), kind, len(packed), len(raw)))
+        data.append(packed)
+    block = struct.pack(SLVW_HEAD, SLVW_MAGIC, SLVW_VERSION, len(records), len(columns))
+    return block + b"".join(head) + b"".join(data)
+
+
+def decode_block(buffer, pos):
+    """(count, {name: bytes or a view of `buffer`}, next block position)"""
+    magic, version, count, ncolumns = struct.unpack_from(SLVW_HEAD, buffer, pos)
+    if magic != SLVW_MAGIC or version != SLVW_VERSION:
+        raise ValueError(f"slvw: bad block at {pos}: {magic!r} {version=}")
+    pos += struct.calcsize(SLVW_HEAD)
+    entries = []
+    for _ in range(ncolumns):
+        entries.append(struct.unpack_from(SLVW_COLUMN, buffer, pos))
+        pos += struct.calcsize(SLVW_COLUMN)
+    columns = {}
+    for name, kind, size, raw_size in entries:
+        name = name.rstrip(b"\x00").decode("ascii")
+        data = buffer[pos : pos + size]
+        if kind == ZSTD:
+            need_zstandard(name)
+            data = zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_size)
+        elif kind == ZLIB:
+            data = zlib.decompress(data)
+        elif kind != RAW:
+            raise ValueError(f"slvw: {name}: unknown codec {kind}")
+        columns[name] = data
+        pos += size
+    return count, columns, pos
+
+
+def block_columns(count, columns, lists=()):
+    """columns of a block as arrays: word (list), length (characters),
+    morph.abc (str), morph (uint32 bits), morph.first (uint8), the flags
+    (bool) and the `lists` (list of lists) it has"""
+    block = {"morph.abc": bytes(columns["morph.abc"]).decode("utf-8")}
+    block["word"], block["length"] = strings(
+        numpy.frombuffer(columns["word.off"], "<u4"), columns["word.txt"]
+    )
+    block["morph"] = numpy.frombuffer(columns["morph"], "<u4")
+    block["morph.first"] = numpy.frombuffer(columns["morph.first"], numpy.uint8)
+    for name in SLVW_FLAGS:
+        flags = numpy.frombuffer(columns[name], numpy.uint8)
+        block[name] = numpy.unpackbits(flags, count=count, bitorder="little").view(bool)
+    for name in lists:
+        if name + ".idx" in columns:
+            items, _ = strings(numpy.frombuffer(columns[name + ".off"], "<u4"), columns[name + ".txt"])
+            idx = numpy.frombuffer(columns[name + ".idx"], "<u4").tolist()
+            block[name] = [items[a:b] for a, b in zip(idx, idx[1:])]
+    return block
+
+
+def read_columns(name, lists=()):
+    """block_columns of every block of a .slvw file"""
+    if os.path.getsize(name) == 0:
+        return
+    buffer, pos = numpy.memmap(name, dtype=numpy.uint8, mode="r"), 0
+    while pos < len(buffer):
+        count, columns, pos = decode_block(buffer, pos)
+        yield block_columns(count, columns, lists)
+
+
+def block_records(count, columns):
+    block = block_columns(count, columns, SLVW_LISTS)
+    abc = block["morph.abc"]
+    morphs = {}
+    fields = {"word": block["word"], "morph": []}
+    for mask, first in zip(block["morph"].tolist(), block["morph.first"].tolist()):
+        key = (mask, first)
+        if key not in morphs:
+            rest = "".join(c for i, c in enumerate(abc) if mask >> i & 1 and i != first)
+            morphs[key] = (abc[first] if first != NO_MORPH else "") + rest
+        fields["morph"].append(morphs[key])
+    for name in SLVW_FLAGS:
+        fields[name] = block[name].tolist()
+    for name in SLVW_LISTS:
+        if name in block:
+            fields[name] = block[name]
+    names = list(fields)
+    for values in zip(*(fields[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def read_columns_records(name):
+    if os.path.getsize(name) == 0:
+        return
+    buffer, pos = numpy.memmap(name, dtype=numpy.uint8, mode="r"), 0
+    while pos < len(buffer):
+        count, columns, pos = decode_block(buffer, pos)
+        yield from block_records(count, columns)
+
+
+class RecordsWriter:
+
+    def __init__(self, name, checkpoint_every=None, resume=False, source=None, codec=None):
+        self.name = name
+        self.columns = name.endswith(".slvw")  # records of a commit go in one block
+        self.codec = codec
+        self.pending = []
+        self.checkpoint_name = name + ".ckpt"
+        self.checkpoint_every = checkpoint_every
+        self.source = source
+        self.state = {}
+        if resume and os.path.exists(self.checkpoint_name):
+            with open(self.checkpoint_name) as ckpt:
+                self.state = json.load(ckpt)
+            if self.state.get("source") != source:
+                raise SystemExit(f"{name}: checkpoint of {self.state.get('source')}")
+        if self.state:
+            self.file = open(name, "r+b")
+            self.file.truncate(self.state["size"])
+            self.file.seek(self.state["size"])
+        else:
+            self.file = open(name, "wb")
+        self.records = self.state.get("records", 0)
+        self.compressor = self.new_compressor()
+
+    def new_compressor(self):
+        if self.columns:
+            return None
+        if self.name.endswith(".bz2"):
+            return bz2.BZ2Compressor()
+        if self.name.endswith(".zst"):
+            need_zstandard(self.name)
+            return zstandard.ZstdCompressor().compressobj()
+        return None
+
+    def write(self, record):
+        if self.columns:
+            self.pending.append(record)
+            self.records += 1
+            return
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compressor:
+            line = self.compressor.compress(line)
+        self.file.write(line)
+        self.records += 1
+
+    def commit(self):
+        # close the current bz2 stream / zstd frame (.slvw block) -- the file
+        # is decodable up to here, a fresh one is started for the following
+        if self.pending:
+            self.file.write(encode_block(self.pending, self.codec))
+            self.pending = []
+        if self.compressor:
+            self.file.write(self.compressor.flush())
+            self.compressor = self.new_compressor()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def checkpoint(self, **position):
+        self.commit()
+        self.state = dict(
+            position, source=self.source, records=self.records, size=self.file.tell()
+        )
+        with open(self.checkpoint_name + ".tmp", "w") as ckpt:
+            json.dump(self.state, ckpt)
+        os.replace(self.checkpoint_name + ".tmp", self.checkpoint_name)
+
+    def close(self):
+        self.commit()
+        self.compressor = None
+        self.file.close()
+        if os.path.exists(self.checkpoint_name):
+            os.remove(self.checkpoint_name)
@@ -0,0 +1,34 @@
+"""
+Read-only Python access to compiled .slvbr.db files: the mapped file
+(SlvbrFile), Go-compatible query tag lines and the TOC-pruned fit search.
+
+    with SlvbrFile("data/db/ru.slvbr.db") as db:
+        query, _ = string_to_tagline(db, "вечность", TagsOpts(min_length=3))
+        count, ids = find_all_lines_by_toc_fit(db, query, limit=1000)
+        words = [db.line_text(i) for i in ids]
+"""
+
+from .bitset import BitsetIndex, find_all_lines_by_index
+from .delta import Delta, find_all_lines_with_delta
+from .hot import HotAnswers, cache_key
+from .queries import TagsOpts, parse_query_line, string_to_tagline
+from .reader import SlvbrFile, Tag
+from .search import Fit, SearchStats, find_all_lines_by_toc_fit, find_all_lines_fit
+
+__all__ = [
+    "BitsetIndex",
+    "Delta",
+    "Fit",
+    "HotAnswers",
+    "SearchStats",
+    "SlvbrFile",
+    "Tag",
+    "TagsOpts",
+    "cache_key",
+    "find_all_lines_by_index",
+    "find_all_lines_by_toc_fit",
+    "find_all_lines_fit",
+    "find_all_lines_with_delta",
+    "parse_query_line",
+    "string_to_tagline",
+]
@@ -0,0 +1,78 @@
+import argparse
+import sys
+
+from . import (
+    BitsetIndex,
+    Delta,
+    SearchStats,
+    SlvbrFile,
+    TagsOpts,
+    find_all_lines_by_index,
+    find_all_lines_by_toc_fit,
+    find_all_lines_with_delta,
+    string_to_tagline,
+)
+from .bitset import verify
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="slvbrdb", description="Query a compiled .slvbr.db the way the backend does."
+    )
+    parser.add_argument("db", type=str)
+    parser.add_argument("queries", nargs="*", type=str)
+    parser.add_argument("--show", action="store_true", help="show the db header")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--min-length", type=int, default=0)
+    parser.add_argument("--only-noun", "-n", action="store_true")
+    parser.add_argument("--index", action="store_true", help="search by the bitset index")
+    parser.add_argument("--delta", type=str, default=None, help="delta db over this one")
+    parser.add_argument(
+        "--verify-index",
+        action="store_true",
+        help="bitset index vs a plain scan, on the queries or on 1000 db words",
+    )
+    args = parser.parse_args()
+
+    with SlvbrFile(args.db) as db:
+        if args.show or not (args.queries or args.verify_index):
+            db.show()
+        opts = TagsOpts(only_noun=args.only_noun, min_length=args.min_length)
+        index = BitsetIndex(db) if args.index or args.verify_index else None
+        overlay = Delta(db, SlvbrFile(args.delta)) if args.delta else None
+        if args.verify_index:
+            step = max(len(db) // 1000, 1)
+            words = args.queries or [db.line_text(i) for i in range(0, len(db), step)]
+            queries = [string_to_tagline(db, q, opts)[0] for q in words]
+            differ = verify(db, index, queries)
+            print(f"bitset index: {len(differ)}/{len(queries)} queries differ from a scan")
+            for query, ids, scan in differ[:10]:
+                print(f"  {bytes(query).hex()}: {len(ids)} ≠ {len(scan)}")
+            index.close()
+            sys.exit(1 if differ else 0)
+        for q in args.queries:
+            stats = SearchStats()
+            query, tagged = string_to_tagline(overlay.delta if overlay else db, q, opts)
+            if tagged == 0:
+                print(f"{q}: no letters of the db", file=sys.stderr)
+                continue
+            if overlay is not None:
+                count, ids = find_all_lines_with_delta(overlay, query, args.limit, stats)
+                print(f"{q}: {count} {stats}", file=sys.stderr)
+                print(" ".join(overlay.line_text(i) for i in ids.tolist()))
+                continue
+            if index is not None:
+                count, ids = find_all_lines_by_index(db, index, query, args.limit, stats)
+            else:
+                count, ids = find_all_lines_by_toc_fit(db, query, 0, args.limit, stats)
+            print(f"{q}: {count} {stats}", file=sys.stderr)
+            print(" ".join(db.line_text(i) for i in ids.tolist()))
+        if index is not None:
+            index.close()
+        if overlay is not None:
+            overlay.close()
+            overlay.delta.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import struct
+import time
+
+import numpy
+
+from .reader import BITSET_INDEX
+from .search import Fit, find_all_lines_fit
+
+# container kinds -- see dbcompiler.BitsetIndex
+ARRAY, BITMAP, RUNS = 1, 2, 3
+CONTAINER_HEAD = "<HHI"
+CHUNK = 1 << 16
+
+
+class BitsetIndex:
+    """letter count bitmaps of a v2 db: bitmap (t, v) -- lines with more than
+    v letters t; the lines fitting the letter tags of a query are the ones in
+    none of the bitmaps (t, q[t])"""
+
+    def __init__(self, db):
+        if BITSET_INDEX not in db.sections:
+            raise ValueError(f"{db.path}: no bitset index section")
+        self.db = db
+        section = db.sections[BITSET_INDEX]
+        self.data = db.buffer[section.offset : section.offset + section.size]
+        count = section.arg
+        tags = len(db.tags)
+        self.directory = numpy.frombuffer(self.data, dtype="<u4", count=2 * tags).reshape(tags, 2)
+        self.offsets = numpy.frombuffer(self.data, dtype="<u4", count=count, offset=8 * tags)
+
+    def close(self):
+        self.directory = self.offsets = self.data = None
+
+    def bitmap(self, t, v):
+        """offset of the bitmap of tag t, threshold v -- None if it is empty"""
+        first, count = self.directory[t].tolist()
+        if v >= count:
+            return None
+        return int(self.offsets[first + v])
+
+    def mark(self, out, pos):
+        # OR the bitmap at `pos` into the bool array `out`
+        (containers,) = struct.unpack_from("<I", self.data, pos)
+        pos += 4
+        for _ in range(containers):
+            key, kind, n = struct.unpack_from(CONTAINER_HEAD, self.data, pos)
+            pos += struct.calcsize(CONTAINER_HEAD)
+            base = key * CHUNK
+            if kind == ARRAY:
+                low = numpy.frombuffer(self.data, dtype="<u2", count=n, offset=pos)
+                out[base + low.astype(numpy.intp)] = True
+                pos += 2 * n
+            elif kind == BITMAP:
+                bits = numpy.frombuffer(self.data, dtype=numpy.uint8, count=CHUNK // 8, offset=pos)
+                bits = numpy.unpackbits(bits, bitorder="little").view(bool)
+                part = out[base : base + CHUNK]
+                part |= bits[: len(part)]
+                pos += CHUNK // 8
+            elif kind == RUNS:
+                runs = numpy.frombuffer(self.data, dtype="<u2", count=2 * n, offset=pos)
+                starts = base + runs[0::2].astype(numpy.intp)
+                lengths = runs[1::2].astype(numpy.intp) + 1
+                # start of its run + place in the run, for every line of the runs
+                shifts = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+                out[numpy.arange(len(shifts)) + shifts] = True
+                pos += 4 * n
+            else:
+                raise ValueError(f"bad container kind {kind} at {pos}")
+
+    def letters_fit(self, query, stats=None):
+        """bool array: lines fitting the letter tags of `query`"""
+        out = numpy.zeros(len(self.db), dtype=bool)
+        read = 0
+        for t in range(len(self.db.tags)):
+            pos = self.bitmap(t, int(query[t]))
+            if pos is not None:
+                self.mark(out, pos)
+                read += 1
+        if stats is not None:
+            stats.pages += read  # bitmaps read
+        return ~out
+
+
+def find_all_lines_by_index(db, index, query, limit=0, stats=None):
+    """FindAllLinesFit over all lines by the bitset index: the letter tags by
+    the bitmaps, the other tags checked on the letter fits only"""
+    started = time.perf_counter()
+    fit = query if isinstance(query, Fit) else Fit(db, query)
+    candidates = numpy.flatnonzero(index.letters_fit(fit.query, stats))
+    ids = candidates[fit.lines(db.tags_matrix[candidates])]
+    if limit > 0:
+        ids = ids[:limit]
+    if stats is not None:
+        stats.queries += 1
+        stats.scanned += len(candidates)
+        stats.found += len(ids)
+        stats.elapsed += time.perf_counter() - started
+    return len(ids), ids
+
+
+def verify(db, index, queries):
+    """(query, index ids, scan ids) of the queries the index and a plain scan
+    of all lines disagree on"""
+    differ = []
+    for query in queries:
+        fit = Fit(db, query)
+        _, ids = find_all_lines_by_index(db, index, fit)
+        scan = find_all_lines_fit(db, fit)
+        if not numpy.array_equal(ids, scan):
+            differ.append((query, ids, scan))
+    return differ
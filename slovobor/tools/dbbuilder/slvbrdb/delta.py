@@ -0,0 +1,61 @@
+import hashlib
+
+import numpy
+
+from .reader import BASE_DELTA
+from .search import Fit, find_all_lines_by_toc_fit
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024**2), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class Delta:
+    """a delta db (dbcompiler --base BASE --delta) over its base: lines are the
+    base ones (less the removed) and then the delta ones, numbered on from
+    len(base)"""
+
+    def __init__(self, base, delta):
+        if BASE_DELTA not in delta.sections:
+            raise ValueError(f"{delta.path}: not a delta db")
+        section = delta.sections[BASE_DELTA]
+        md5 = bytes(delta.buffer[section.offset : section.offset + 16])
+        if md5 != file_md5(base.path) or section.arg != len(base):
+            raise ValueError(f"{delta.path}: a delta of another db than {base.path}")
+        if [(t.type, t.value) for t in base.tags] != [(t.type, t.value) for t in delta.tags]:
+            raise ValueError(f"{delta.path}: tags differ from {base.path}")
+        self.base, self.delta = base, delta
+        self.removed = numpy.frombuffer(
+            delta.buffer, dtype="<u4", count=section.item_count, offset=section.offset + 16
+        )
+
+    def close(self):
+        self.removed = None
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + len(self.delta)
+
+    def line_text(self, i):
+        if i < len(self.base):
+            return self.base.line_text(i)
+        return self.delta.line_text(i - len(self.base))
+
+
+def find_all_lines_with_delta(overlay, query, limit=0, stats=None):
+    """find_all_lines_by_toc_fit over the base and its delta: base fits less
+    the removed lines, then the delta fits; `query` of string_to_tagline on
+    the delta db (it has no tag maxima to clamp by the base ones)"""
+    base, delta = overlay.base, overlay.delta
+    _, ids = find_all_lines_by_toc_fit(base, Fit(base, query), 0, 0, stats)
+    ids = ids[~numpy.isin(ids, overlay.removed)]
+    if limit <= 0 or len(ids) < limit:
+        left = limit - len(ids) if limit > 0 else 0
+        _, added = find_all_lines_by_toc_fit(delta, Fit(delta, query), 0, left, stats)
+        ids = numpy.concatenate([ids, added + len(base)])
+    if limit > 0:
+        ids = ids[:limit]
+    return len(ids), ids
@@ -0,0 +1,86 @@
+import numpy
+
+from .reader import HOT_ANSWERS
+
+# Go hash/crc64 with crc64.ISO, as makeCacheKey uses it
+CRC64_ISO = 0xD800000000000000
+
+
+def crc64_table(poly):
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC64_ISO_TABLE = crc64_table(CRC64_ISO)
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def crc64(data, crc=0):
+    crc ^= MASK64
+    for byte in data:
+        crc = CRC64_ISO_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ MASK64
+
+
+def cache_key(query, page_no=0, limit=0):
+    """Go makeCacheKey: crc64 (ISO) of the query tag line, page and limit
+    (big-endian uint32 each)"""
+    data = bytes(query)
+    data += (page_no & 0xFFFFFFFF).to_bytes(4, "big")
+    data += (limit & 0xFFFFFFFF).to_bytes(4, "big")
+    return crc64(data)
+
+
+SLOT_DTYPE = numpy.dtype([("key", "<u8"), ("first", "<u4"), ("count", "<u4")])
+EMPTY = 0xFFFFFFFF
+SPREAD = 0x9E3779B97F4A7C15
+
+
+def home(key, slots):
+    # top bits of key × 2^64/φ -- see dbcompiler.HotAnswers
+    return ((key * SPREAD) & MASK64) >> (65 - slots.bit_length())
+
+
+class HotAnswers:
+    """precomputed answers of a v2 db: open addressing table of slots,
+    a key is looked up at its home slot and on up to an empty slot"""
+
+    def __init__(self, db):
+        if HOT_ANSWERS not in db.sections:
+            raise ValueError(f"{db.path}: no hot answers section")
+        section = db.sections[HOT_ANSWERS]
+        self.limit = section.arg
+        self.slots = numpy.frombuffer(
+            db.buffer, dtype=SLOT_DTYPE, count=section.item_count, offset=section.offset
+        )
+        records = section.offset + section.item_count * SLOT_DTYPE.itemsize
+        self.records = numpy.frombuffer(
+            db.buffer,
+            dtype="<u4",
+            count=(section.size - section.item_count * SLOT_DTYPE.itemsize) // 4,
+            offset=records,
+        )
+
+    def close(self):
+        self.slots = self.records = None
+
+    def __len__(self):
+        return int((self.slots["first"] != EMPTY).sum())
+
+    def get(self, key):
+        """line ids of the answer, None if there is none"""
+        mask = len(self.slots) - 1
+        i = home(key, len(self.slots))
+        for _ in range(len(self.slots)):
+            key_, first, count = self.slots[i].tolist()
+            if first == EMPTY:
+                return None
+            if key_ == key:
+                return self.records[first : first + count].astype(numpy.intp)
+            i = (i + 1) & mask
+        return None
@@ -0,0 +1,74 @@
+import re
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+import numpy
+
+from .reader import Tag
+
+# Go slovobor.TagsOpts
+TagsOpts = namedtuple(
+    "TagsOpts",
+    ["only_noun", "no_topo", "no_nomen", "not_offensive", "min_length"],
+    defaults=[False, False, False, False, 0],
+)
+
+LOG_QUERY_RE = re.compile(r"\bq=(.*) (\d+) o=(\d+) n=(\d+)\s*$")
+
+
+def parse_query_line(line):
+    """(q, o, n) of a corpus line, None if there is no query in it"""
+    line = line.rstrip("\r\n")
+    if not line.strip() or line.startswith("#"):
+        return None
+    if mo := LOG_QUERY_RE.search(line):
+        return mo.group(1), int(mo.group(3)), int(mo.group(4))
+    if "q=" in line:
+        form = parse_qs(line[line.index("q=") :].split()[0])
+        if "q" in form:
+            o, n = form.get("o", ["0"])[0], form.get("n", ["0"])[0]
+            return form["q"][0], int0(o), int0(n)
+    if "\t" in line or " " not in line.strip():
+        return line.strip().split("\t")[0], 0, 0
+    return None
+
+
+def int0(s):
+    try:
+        return int(s)
+    except ValueError:
+        return 0
+
+
+def string_to_tagline(db, q, opts=None):
+    """query tag line (uint8 array) and the number of counted letters --
+    the same bytes Go DB.StringToTagLine makes"""
+    q = q.lower()
+    query = numpy.zeros(len(db.tags), dtype=numpy.uint8)
+    total = 0
+    for i, tag in enumerate(db.tags):
+        if tag.type == Tag.LETTER:
+            count = q.count(tag.value) if len(tag.value) == 1 else 0
+            query[i] = count % 256
+            total += count
+
+    # magic tagging
+    if opts is not None:
+        if opts.min_length > 0:
+            query[-4] = opts.min_length % 256  # length
+        if opts.only_noun:
+            query[-3] = 78  # morph=N|V|A
+            query[-2] = 2  # topo=false
+            query[-1] = 2  # nomen=false
+
+    return canonical(db, query), total
+
+
+def canonical(db, query):
+    """letter counts over the db maxima clamped to them: the same lines fit,
+    the query has the same cache key as any other asking for as much"""
+    if db.tag_maxima is None:
+        return query
+    letters = db.tag_types == Tag.LETTER
+    query[letters] = numpy.minimum(query[letters], db.tag_maxima[letters])
+    return query
@@ -0,0 +1,326 @@
+import mmap
+import struct
+
+import numpy
+
+# DB := MAGIC (8b) META (+b) RECORDS (+b) BOG (+b) TOC (+b)
+# DB v2 := DB v1 + SECTIONS (+b), described in META v2
+# DB v3 := DB v2 with packed RECORDS and TOC, described in META v3
+#   -- see dbcompiler.SlvbrDB; everything here is a view of the mapped file,
+#   but the records and toc of v3, decoded once into arrays
+
+MAGIC = b"!slvBR"
+MAGIC_TEMPLATE = "<6sH"
+VERSIONS = (1, 2, 3)
+
+META_TEMPLATE = "<128s8sIIIIIIIIIII"
+META_FIELDS = (
+    "title",
+    "encoding",
+    "meta_len",
+    "lines_count",
+    "line_len",
+    "tags_count",
+    "tag_len",
+    "tag_type_len",
+    "tag_value_len",
+    "line_data_len",
+    "bog_len",
+    "toc_len",
+    "toc_count",
+)
+
+META_V2_TEMPLATE = "<II"  # FEATURES, SECTIONS_COUNT
+
+PACKING_TEMPLATE = "<III"
+PACKING_FIELDS = ("packed_tags", "ptr_bits", "len_bits")
+NIBBLE_ESCAPE = 0x0F
+
+SECTION_TEMPLATE = "<IIIIII"
+SECTION_FIELDS = ("id", "offset", "size", "item_len", "item_count", "arg")
+
+# section ids
+SUPER_TOC = 1
+PAGE_SUMMARY = 2
+BITSET_INDEX = 3
+HOT_ANSWERS = 4
+TAG_MAXIMA = 5
+PACK_ESCAPES = 6
+BASE_DELTA = 7
+
+TAG_TYPE_FORMAT = {1: "B", 2: "H", 4: "I"}
+
+
+class Meta:
+
+    def __init__(self, version, values):
+        self.version = version
+        for name, value in zip(META_FIELDS, values):
+            setattr(self, name, value)
+        self.title = self.title.rstrip(b"\x00").decode("ascii")
+        self.encoding = self.encoding.rstrip(b"\x00").decode("ascii")
+
+    @property
+    def lines_offset(self):
+        return self.meta_len
+
+    @property
+    def bog_offset(self):
+        return self.lines_offset + self.lines_count * self.line_len
+
+    @property
+    def toc_offset(self):
+        return self.bog_offset + self.bog_len
+
+    def __repr__(self):
+        return " ".join(f"{name}={getattr(self, name)!r}" for name in META_FIELDS)
+
+
+class Section:
+
+    def __init__(self, values):
+        for name, value in zip(SECTION_FIELDS, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return " ".join(f"{name}={getattr(self, name)}" for name in SECTION_FIELDS)
+
+
+class Packing:
+    """v3 records: the first `packed_tags` tags (letters) as nibbles, the
+    rest as bytes, the body as BOG_PTR | BOG_LEN << ptr_bits"""
+
+    def __init__(self, values):
+        for name, value in zip(PACKING_FIELDS, values):
+            setattr(self, name, value)
+
+    @property
+    def nibbles_len(self):
+        return (self.packed_tags + 1) // 2
+
+    def tags(self, raw, tags_count):
+        # N × packed bytes → N × tags_count values (nibble escapes left as 15)
+        nibbles = raw[:, : self.nibbles_len]
+        letters = numpy.empty((len(raw), 2 * self.nibbles_len), dtype=numpy.uint8)
+        letters[:, 0::2] = nibbles & 0x0F
+        letters[:, 1::2] = nibbles >> 4
+        rest = raw[:, self.nibbles_len : self.nibbles_len + tags_count - self.packed_tags]
+        return numpy.column_stack([letters[:, : self.packed_tags], rest])
+
+    def bodies(self, raw):
+        # N × BODY_LEN bytes → N × (ptr, len)
+        body = numpy.zeros((len(raw), 8), dtype=numpy.uint8)
+        body[:, : raw.shape[1]] = raw
+        body = body.view("<u8")[:, 0]
+        ptrs = body & numpy.uint64((1 << self.ptr_bits) - 1)
+        return numpy.column_stack([ptrs, body >> numpy.uint64(self.ptr_bits)]).astype("<u4")
+
+    def __repr__(self):
+        return " ".join(f"{name}={getattr(self, name)}" for name in PACKING_FIELDS)
+
+
+class Tag:
+
+    # tag types, as Go Tag.Fit reads them
+    LETTER, LENGTH, MORPH, FLAG = 0, 1, 2, 3
+
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+
+    def __repr__(self):
+        return f"{self.value}[{self.type}]"
+
+
+class SlvbrFile:
+    """Memory-mapped .slvbr.db: header parsed in place, records, bog and toc
+    are numpy / memoryview views of the map (nothing is copied)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+        self.read_header()
+        self.read_body()
+
+    def close(self):
+        # views must go before the map
+        self.records = self.tags_matrix = self.bodies = None
+        self.toc = self.toc_tags = self.toc_pages = None
+        self.super_toc = self.super_tags = self.super_pages = None
+        self.page_summary = self.tag_maxima = None
+        self.lines_index = self.bog = None
+        self.buffer.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_header(self):
+        magic, version = struct.unpack_from(MAGIC_TEMPLATE, self.buffer, 0)
+        if magic != MAGIC or version not in VERSIONS:
+            raise ValueError(f"{self.path}: not a slvBR db: {magic!r} {version=}")
+        pos = struct.calcsize(MAGIC_TEMPLATE)
+        self.meta = Meta(version, struct.unpack_from(META_TEMPLATE, self.buffer, pos))
+        pos += struct.calcsize(META_TEMPLATE)
+
+        self.features, self.sections, self.packing = 0, {}, None
+        if version >= 2:
+            self.features, count = struct.unpack_from(META_V2_TEMPLATE, self.buffer, pos)
+            pos += struct.calcsize(META_V2_TEMPLATE)
+            if version >= 3:
+                self.packing = Packing(struct.unpack_from(PACKING_TEMPLATE, self.buffer, pos))
+                pos += struct.calcsize(PACKING_TEMPLATE)
+            for _ in range(count):
+                section = Section(struct.unpack_from(SECTION_TEMPLATE, self.buffer, pos))
+                self.sections[section.id] = section
+                pos += struct.calcsize(SECTION_TEMPLATE)
+
+        meta = self.meta
+        if meta.tag_len != 1:
+            raise ValueError(f"{self.path}: unsupported {meta.tag_len=}")
+        tag_template = "<%s%ds" % (
+            TAG_TYPE_FORMAT[meta.tag_type_len],
+            meta.tag_value_len,
+        )
+        self.tags = []
+        for type, value in struct.iter_unpack(
+            tag_template,
+            self.buffer[pos : pos + meta.tags_count * struct.calcsize(tag_template)],
+        ):
+            value = value.rstrip(b"\x00").decode(meta.encoding, errors="ignore")
+            self.tags.append(Tag(type, value))
+        self.tag_types = numpy.array([t.type for t in self.tags], dtype=numpy.uint16)
+
+    def read_body(self):
+        meta = self.meta
+        tags_len = meta.tags_count * meta.tag_len
+
+        self.lines_index = self.buffer[meta.lines_offset : meta.bog_offset]
+        self.bog = self.buffer[meta.bog_offset : meta.toc_offset]
+        if self.packing is not None:
+            self.read_packed()
+            return
+
+        self.records = numpy.frombuffer(
+            self.buffer,
+            dtype=numpy.dtype(
+                [("tags", numpy.uint8, (tags_len,)), ("body", "<u4", (2,))],
+                align=False,
+            ),
+            count=meta.lines_count,
+            offset=meta.lines_offset,
+        )
+        assert self.records.itemsize == meta.line_len, f"{meta.line_len=}"
+        self.tags_matrix = self.records["tags"]
+        self.bodies = self.records["body"]
+
+        page_dtype = numpy.dtype([("tags", numpy.uint8, (tags_len,)), ("page", "<u4", (2,))])
+        self.toc = numpy.frombuffer(
+            self.buffer, dtype=page_dtype, count=meta.toc_count, offset=meta.toc_offset
+        )
+        assert self.toc.itemsize == meta.toc_len, f"{meta.toc_len=}"
+        self.toc_tags = self.toc["tags"]
+        self.toc_pages = self.toc["page"]
+
+        # super toc: per K toc pages -- their minimum, first page and count
+        self.super_toc = self.super_tags = self.super_pages = None
+        if SUPER_TOC in self.sections:
+            self.super_toc = self.section_array(SUPER_TOC, page_dtype)
+            self.super_tags = self.super_toc["tags"]
+            self.super_pages = self.super_toc["page"]
+
+        self.read_sections()
+
+    def read_packed(self):
+        # v3: records and toc pages decoded into the same shapes as v1 views
+        meta, packing = self.meta, self.packing
+        tags_len = packing.nibbles_len + meta.tags_count - packing.packed_tags
+        assert tags_len + meta.line_data_len == meta.line_len, f"{meta.line_len=}"
+        assert tags_len + 8 == meta.toc_len, f"{meta.toc_len=}"
+
+        self.records = self.packed_array(meta.lines_offset, meta.lines_count, meta.line_len)
+        self.tags_matrix = packing.tags(self.records, meta.tags_count)
+        self.bodies = packing.bodies(self.records[:, tags_len:])
+        if PACK_ESCAPES in self.sections:
+            escapes = self.section_array(
+                PACK_ESCAPES, numpy.dtype([("line", "<u4"), ("tag", "<u2"), ("value", "<u2")])
+            )
+            self.tags_matrix[escapes["line"], escapes["tag"]] = escapes["value"]
+
+        self.toc = self.packed_array(meta.toc_offset, meta.toc_count, meta.toc_len)
+        self.toc_tags = packing.tags(self.toc, meta.tags_count)
+        self.toc_pages = numpy.ascontiguousarray(self.toc[:, tags_len:]).view("<u4")
+
+        self.super_toc = self.super_tags = self.super_pages = None
+        if SUPER_TOC in self.sections:
+            section = self.sections[SUPER_TOC]
+            self.super_toc = self.packed_array(section.offset, section.item_count, section.item_len)
+            self.super_tags = packing.tags(self.super_toc, meta.tags_count)
+            self.super_pages = numpy.ascontiguousarray(self.super_toc[:, tags_len:]).view("<u4")
+
+        self.read_sections()
+
+    def packed_array(self, offset, count, item_len):
+        return numpy.frombuffer(
+            self.buffer, dtype=numpy.uint8, count=count * item_len, offset=offset
+        ).reshape(count, item_len)
+
+    def read_sections(self):
+        tags_len = self.meta.tags_count * self.meta.tag_len
+
+        # tag maxima: the highest value of every tag over all lines
+        self.tag_maxima = None
+        if TAG_MAXIMA in self.sections:
+            self.tag_maxima = self.section_array(TAG_MAXIMA, numpy.uint8)
+
+        # page summary: per toc page letter masks, fewest letters, tag highs
+        self.page_summary = None
+        if PAGE_SUMMARY in self.sections:
+            self.page_summary = self.section_array(
+                PAGE_SUMMARY,
+                numpy.dtype(
+                    [
+                        ("any", "<u8"),
+                        ("all", "<u8"),
+                        ("min_letters", "<u2"),
+                        ("high", numpy.uint8, (tags_len,)),
+                    ]
+                ),
+            )
+
+    def section_array(self, section_id, dtype):
+        section = self.sections[section_id]
+        assert numpy.dtype(dtype).itemsize == section.item_len, f"{section=}"
+        return numpy.frombuffer(
+            self.buffer, dtype=dtype, count=section.item_count, offset=section.offset
+        )
+
+    def __len__(self):
+        return self.meta.lines_count
+
+    def line_bytes(self, i):
+        ptr, size = self.bodies[i].tolist()
+        return bytes(self.bog[ptr : ptr + size])
+
+    def line_text(self, i):
+        return self.line_bytes(i).decode(self.meta.encoding, errors="replace")
+
+    def show(self, lines=10):
+        print(f"{self.path}: v{self.meta.version} {self.meta}")
+        if self.packing is not None:
+            print(f"packing: {self.packing}")
+        for section in self.sections.values():
+            print(f"section: {section}")
+        print(f"tags: {len(self.tags)} {' '.join(map(repr, self.tags))}")
+        for i in range(len(self) // 3, min(len(self) // 3 + lines, len(self))):
+            tags = bytes(self.tags_matrix[i]).hex()
+            print(f"[{i:3d}] {tags} {self.bodies[i].tolist()} {self.line_text(i)}")
+        counts = self.toc_pages[:, 1]
+        print(f"toc: {int(counts.sum())}÷{len(counts)}")
+        print(f"bog: {len(self.bog)} ({len(self.bog) / 1024**2:.2f}MB)")
@@ -0,0 +1,143 @@
+import time
+
+import numpy
+
+from .reader import SUPER_TOC, Tag
+
+PAGE_SUMMARY_LETTERS = 64  # letter tags in the page summary masks
+
+
+class SearchStats:
+    """what a search has touched, summed over the searches it was passed to:
+    toc pages checked, pages scanned (passed the toc check), records scanned"""
+
+    FIELDS = ("queries", "pages", "pages_scanned", "scanned", "found")
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        values = " ".join(f"{name}={getattr(self, name)}" for name in self.FIELDS)
+        return f"{values} elapsed={self.elapsed * 1000:.2f}ms"
+
+
+class Fit:
+    """Go Tag.Fit of one query over whole blocks of records:
+
+    type 0 (letter): q >= r
+    type 1 (length): q == 0 || q <= r
+    type 2, 3 (morph, flags): q == 0 || q == r
+    other: always fits
+    """
+
+    def __init__(self, db, query):
+        types = db.tag_types
+        query = numpy.asarray(query, dtype=numpy.uint8)
+        self.query = query
+        self.letters = numpy.flatnonzero(types == Tag.LETTER)
+        self.letters_query = query[self.letters]
+        bound = query != 0
+        self.lengths = numpy.flatnonzero((types == Tag.LENGTH) & bound)
+        self.lengths_query = query[self.lengths]
+        self.equals = numpy.flatnonzero(
+            ((types == Tag.MORPH) | (types == Tag.FLAG)) & bound
+        )
+        self.equals_query = query[self.equals]
+        present = self.letters_query[: PAGE_SUMMARY_LETTERS] > 0
+        bits = numpy.left_shift(numpy.uint64(1), numpy.arange(len(present), dtype=numpy.uint64))
+        self.letters_mask = numpy.uint64((present * bits).sum(dtype=numpy.uint64))
+        self.letters_total = int(self.letters_query.sum(dtype=numpy.int64))
+        # a length, morph or flag value over the db maxima: no line fits
+        self.none = False
+        if db.tag_maxima is not None:
+            bounded = numpy.concatenate([self.lengths, self.equals])
+            self.none = bool((query[bounded] > db.tag_maxima[bounded]).any())
+
+    def pages(self, toc_tags):
+        # Go prunes pages by the letter tags only
+        return (toc_tags[:, self.letters] <= self.letters_query).all(axis=1)
+
+    def summaries(self, summary):
+        # Go DB.pageSummaryFits: a page may hold a fitting line
+        mask = self.letters_mask
+        fits = (summary["all"] & ~mask) == 0
+        fits &= (summary["any"] & mask) != 0
+        fits &= summary["min_letters"] <= self.letters_total
+        high = summary["high"]
+        if len(self.lengths):
+            fits &= (high[:, self.lengths] >= self.lengths_query).all(axis=1)
+        if len(self.equals):
+            q = self.equals_query
+            fits &= ((high[:, self.equals] & q) == q).all(axis=1)
+        return fits
+
+    def lines(self, tags):
+        fits = (tags[:, self.letters] <= self.letters_query).all(axis=1)
+        if len(self.lengths):
+            fits &= (tags[:, self.lengths] >= self.lengths_query).all(axis=1)
+        if len(self.equals):
+            fits &= (tags[:, self.equals] == self.equals_query).all(axis=1)
+        return fits
+
+
+def find_all_lines_fit(db, fit, start=0, length=0, limit=0, stats=None):
+    """Go DB.FindAllLinesFit: fitting lines of [start, start+length),
+    stops as soon as `limit` lines are found"""
+    stop = len(db) if length == 0 else min(start + length, len(db))
+    found = numpy.flatnonzero(fit.lines(db.tags_matrix[start:stop])) + start
+    scanned = stop - start
+    if limit > 0 and len(found) >= limit:
+        found = found[:limit]
+        scanned = int(found[-1]) - start + 1
+    if stats is not None:
+        stats.scanned += max(scanned, 0)
+    return found
+
+
+def find_all_lines_by_toc_fit(db, query, page_no=0, limit=0, stats=None):
+    """Go DB.FindAllLinesByTocFit: lines of the toc pages that may fit,
+    a page is scanned for what is left up to `limit`"""
+    started = time.perf_counter()
+    fit = query if isinstance(query, Fit) else Fit(db, query)
+    if fit.none:
+        page_no = len(db.toc)
+    fits = fit.pages(db.toc_tags[page_no:])
+    checks = numpy.ones(len(fits), dtype=numpy.int64)  # toc entries read per page
+
+    if db.super_toc is not None:
+        # a super page is checked at its first page, a failed one skips its
+        # K pages (the first group, when started inside of it, is not checked)
+        k = db.sections[SUPER_TOC].arg
+        groups = numpy.arange(page_no, page_no + len(fits)) // k
+        super_fits = fit.pages(db.super_tags)[groups]
+        super_fits[groups == page_no // k] |= page_no % k != 0
+        firsts = numpy.arange(page_no, page_no + len(fits)) % k == 0
+        checks = numpy.where(super_fits, 1, 0) + firsts
+        fits &= super_fits
+
+    if db.page_summary is not None:
+        fits &= fit.summaries(db.page_summary[page_no:])
+
+    pages = numpy.flatnonzero(fits) + page_no
+    found, total, scanned, checked = [], 0, 0, int(checks.sum())
+    for page in pages.tolist():
+        start, count = db.toc_pages[page].tolist()
+        left = limit - total if limit > 0 else 0
+        page_found = find_all_lines_fit(db, fit, start, count, left, stats)
+        found.append(page_found)
+        total += len(page_found)
+        scanned += 1
+        if limit > 0 and total >= limit:
+            checked = int(checks[: page - page_no + 1].sum())
+            break
+
+    ids = numpy.concatenate(found) if found else numpy.empty(0, dtype=numpy.intp)
+    if stats is not None:
+        stats.queries += 1
+        stats.pages += checked
+        stats.pages_scanned += scanned
+        stats.found += len(ids)
+        stats.elapsed += time.perf_counter() - started
+    return len(ids), ids